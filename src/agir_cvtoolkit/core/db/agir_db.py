@@ -153,8 +153,10 @@ class QueryBuilder:
         print(f"Preview: First {n} records")
         print(f"{'='*60}\n")
         
-        # Take only first n records from the query results
-        records = list(islice(self.execute(), n))
+        # Push the preview size into the SQL LIMIT so only n rows are fetched
+        spec = self.to_spec()
+        spec.limit = min(n, spec.limit or n)
+        records = list(islice(self._db.query(spec), n))
         
         if not records:
             print("⚠️  No records found matching your query.\n")
@@ -233,6 +235,11 @@ class AgirDB:
         
         return cls(db_type, Path(db_path), table, id_col)
     
+    def schema(self) -> Dict[str, str]:
+        """Return {column: declared SQLite type} for the table, in table order."""
+        con = self._get_connection()
+        return {r[1]: (r[2] or "").upper() for r in con.execute(f"PRAGMA table_info({self.table})")}
+    
     def get_by_image_id(self, image_id: str) -> Optional[ImageRecord]:
         """Get a single record by image_id (if applicable)."""
         if self.db_type != "semif":
@@ -14,12 +14,12 @@ class SqlWhere:
     sql: str
     params: Tuple[Any, ...]
 
-_rx_null = __import__("re").compile(r"^\s*(?P<key>\w+)\s+is\s+(?P<neg>not\s+)?null\s*$", __import__("re").IGNORECASE)
-_rx_range = __import__("re").compile(r"^\s*(?P<key>\w+)\s*(?:in|between)\s*\[(?P<lo>.+?),(?P<hi>.+?)\]\s*$", __import__("re").IGNORECASE)
-_rx_bin = __import__("re").compile(r"^\s*(?P<key>\w+)\s*(?P<op>==|>=|<=|>|<)\s*(?P<rhs>.+?)\s*$")
-_rx_range2 = __import__("re").compile(
+_rx_null = re.compile(r"^\s*(?P<key>\w+)\s+is\s+(?P<neg>not\s+)?null\s*$", re.IGNORECASE)
+_rx_range = re.compile(r"^\s*(?P<key>\w+)\s*(?:in|between)\s*\[(?P<lo>.+?),(?P<hi>.+?)\]\s*$", re.IGNORECASE)
+_rx_bin = re.compile(r"^\s*(?P<key>\w+)\s*(?P<op>==|>=|<=|>|<)\s*(?P<rhs>.+?)\s*$")
+_rx_range2 = re.compile(
     r"^\s*(?P<key>\w+)\s*between\s+(?P<lo>.+?)\s+and\s+(?P<hi>.+?)\s*$",
-    __import__("re").IGNORECASE
+    re.IGNORECASE
 )
 
 def _lit(text: str):
@@ -214,8 +214,9 @@ class CVATUploadStage:
         log.info(f"Loaded {len(manifest)} entries from manifest")
         
         # Build lookup: record_id -> record
+        # Keyed by string ID: the Parquet manifest stores record_id as a string
         record_lookup = {
-            rec.get("cutout_id", rec.get("id")): rec 
+            str(rec.get("cutout_id", rec.get("id"))): rec 
             for rec in records
         }
         
@@ -240,7 +241,7 @@ class CVATUploadStage:
                 continue
             
             # Get corresponding record
-            record = record_lookup.get(record_id)
+            record = record_lookup.get(str(record_id))
             if not record:
                 log.warning(f"Record not found for {record_id}, skipping")
                 self.metrics["skipped"] += 1
@@ -599,8 +600,10 @@ class CVATUploadStage:
         return data
     
     def _load_manifest(self) -> List[Dict]:
-        """Load manifest from seg-infer stage."""
-        manifest_path = self.run_root / "manifest.csv"  # CHANGED: .jsonl -> .csv
+        """Load manifest from seg-infer stage (Parquet if present, else CSV)."""
+        manifest_path = self.run_root / "manifest.parquet"
+        if not manifest_path.exists():
+            manifest_path = self.run_root / "manifest.csv"
         
         if not manifest_path.exists():
             raise FileNotFoundError(
@@ -610,8 +613,11 @@ class CVATUploadStage:
         
         log.info(f"Loading manifest from: {manifest_path}")
         
-        # Read CSV with pandas
-        df = pd.read_csv(manifest_path)
+        # Read with pandas
+        if manifest_path.suffix == ".parquet":
+            df = pd.read_parquet(manifest_path)
+        else:
+            df = pd.read_csv(manifest_path)
         
         # Convert to list of dicts
         records = df.to_dict(orient='records')
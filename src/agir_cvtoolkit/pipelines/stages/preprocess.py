@@ -12,14 +12,20 @@ Workflow:
 6. Compute dataset statistics for normalization
 """
 
+import hashlib
 import json
 import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterator
 
-from omegaconf import DictConfig
+from omegaconf import DictConfig, OmegaConf
 
-from agir_cvtoolkit.core.db import AgirDB
+from agir_cvtoolkit.pipelines.utils.file_utils import fast_copy, place_file, write_json
 from agir_cvtoolkit.pipelines.utils.preprocess_utils import (
+    assign_splits,
     pad_gridcrop_resize_preprocess,
     train_val_test_split,
     compute_rgb_mean_std,
@@ -28,6 +34,38 @@ from agir_cvtoolkit.pipelines.utils.image_resolver import ImageResolver
 
 log = logging.getLogger(__name__)
 
+# Lowercased filename suffixes; matched with a single str.endswith call per name
+_JPEG_SUFFIXES = (".jpg", ".jpeg")
+_IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+# Written to run_root on success; lets training skip re-scanning the split dirs
+PREPROCESS_MANIFEST = ".preprocess_manifest.json"
+
+
+def preprocess_config_hash(preprocess_cfg: DictConfig) -> str:
+    """Stable hash of the resolved preprocess config (key order independent)."""
+    container = OmegaConf.to_container(preprocess_cfg, resolve=True)
+    encoded = json.dumps(container, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def _iter_images(directory: Path, suffixes: tuple[str, ...] = _IMAGE_SUFFIXES) -> Iterator[os.DirEntry]:
+    """
+    Yield files in a directory whose name ends with one of suffixes (case-insensitive).
+
+    Uses a single os.scandir pass; DirEntry.is_file reuses the dirent type, so
+    no extra stat is needed per entry on Linux. A missing directory yields
+    nothing (like glob on a nonexistent path).
+    """
+    try:
+        it = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    with it:
+        for entry in it:
+            if entry.name.lower().endswith(suffixes) and entry.is_file():
+                yield entry
+
 
 class PreprocessStage:
     """Preprocessing stage for training data preparation."""
@@ -37,6 +75,17 @@ class PreprocessStage:
         self.preprocess_cfg = cfg.preprocess
         self.paths = cfg.paths
         self.run_root = Path(cfg.paths.run_root)
+        self.preprocessed_root = Path(cfg.paths.preprocessed)
+        self.metrics_path = Path(cfg.paths.metrics_path)
+        
+        # Resolve step configs to plain dicts once: they are read repeatedly
+        # and pickled to worker processes, both much cheaper than DictConfig
+        self.resize_cfg = OmegaConf.to_container(self.preprocess_cfg.pad_gridcrop_resize, resolve=True)
+        self.split_cfg = OmegaConf.to_container(self.preprocess_cfg.split, resolve=True)
+        self.stats_cfg = OmegaConf.to_container(self.preprocess_cfg.compute_data_stats, resolve=True)
+        self.do_resize = bool(self.resize_cfg.get("enabled", False))
+        self.do_split = bool(self.split_cfg.get("enabled", False))
+        self.do_stats = bool(self.stats_cfg.get("enabled", False))
         
         # Metrics tracking
         self.metrics = {
@@ -52,6 +101,9 @@ class PreprocessStage:
             "total_tasks": 0,
             "resolution_stats": {},
         }
+        
+        # Names of aggregated CVAT tasks (set by _aggregate_tasks)
+        self._task_names: tuple[str, ...] = ()
     
     def _find_source_data(self) -> tuple[Path, Path]:
         """
@@ -165,17 +217,26 @@ class PreprocessStage:
         log.info(f"Aggregating {len(task_dirs)} CVAT tasks...")
         log.info("=" * 80)
         
-        # Create combined directories
-        combined_images = Path(self.paths.preprocessed) / "images"
-        combined_masks = Path(self.paths.preprocessed) / "masks"
+        # Create combined directories. Links share their data with the task
+        # files, so they go in their own directory: pad/grid-crop/resize writes
+        # preprocessed/images|masks under the source filenames and would
+        # otherwise write through a link into the original downloads
+        mode = self.preprocess_cfg.get("aggregate_mode", "copy")
+        combined_root = self.preprocessed_root / "aggregated" if mode != "copy" else self.preprocessed_root
+        combined_images = combined_root / "images"
+        combined_masks = combined_root / "masks"
         combined_images.mkdir(parents=True, exist_ok=True)
         combined_masks.mkdir(parents=True, exist_ok=True)
         
-        import shutil
+        # Per-task stats as parallel columns; rows are built once for metrics
+        task_names: list[str] = []
+        task_image_counts: list[int] = []
+        task_mask_counts: list[int] = []
         
-        total_images = 0
-        total_masks = 0
-        task_stats = []
+        # Collect (src, dst) copy jobs first; duplicates are detected in memory
+        copy_jobs: list[tuple[Path, Path]] = []
+        emitted_images: set[str] = set()
+        emitted_masks: set[str] = set()
         
         for task_dir in task_dirs:
             log.info(f"Processing task: {task_dir.name}")
@@ -191,18 +252,17 @@ class PreprocessStage:
             # Copy images if they exist
             copied_images = 0
             if images_dir.exists():
-                task_images = list(images_dir.glob("*.jpg")) + list(images_dir.glob("*.JPG"))
-                for img_path in task_images:
+                for img_entry in _iter_images(images_dir, _JPEG_SUFFIXES):
                     # Create unique filename: taskname_originalname
-                    new_name = f"{img_path.name}"
-                    dest_path = combined_images / new_name
+                    new_name = img_entry.name
                     
-                    # Skip if already exists (avoid duplicates)
-                    if dest_path.exists():
+                    # Skip if already emitted by an earlier task (avoid duplicates)
+                    if new_name in emitted_images:
                         log.warning(f"  Skipping duplicate: {new_name}")
                         continue
                     
-                    shutil.copy2(img_path, dest_path)
+                    emitted_images.add(new_name)
+                    copy_jobs.append((Path(img_entry.path), combined_images / new_name))
                     copied_images += 1
             
             # Copy masks
@@ -210,49 +270,53 @@ class PreprocessStage:
                 log.warning(f"  No masks directory found, skipping masks")
                 continue
             
-            task_masks = list(masks_dir.glob("*_mask.png")) + list(masks_dir.glob("*.png"))
             copied_masks = 0
-            for mask_path in task_masks:
+            for mask_entry in _iter_images(masks_dir, (".png",)):
                 # Match the renamed image
-                new_name = f"{mask_path.name}"
-                dest_path = combined_masks / new_name
+                new_name = mask_entry.name
                 
-                if dest_path.exists():
+                if new_name in emitted_masks:
                     log.warning(f"  Skipping duplicate mask: {new_name}")
                     continue
                 
-                shutil.copy2(mask_path, dest_path)
+                emitted_masks.add(new_name)
+                copy_jobs.append((Path(mask_entry.path), combined_masks / new_name))
                 copied_masks += 1
             
-            log.info(f"  Copied {copied_images} images, {copied_masks} masks")
-            
-            total_images += copied_images
-            total_masks += copied_masks
+            log.info(f"  Found {copied_images} images, {copied_masks} masks to copy")
             
-            task_stats.append({
-                "task_name": task_dir.name,
-                "images": copied_images,
-                "masks": copied_masks,
-            })
+            task_names.append(task_dir.name)
+            task_image_counts.append(copied_images)
+            task_mask_counts.append(copied_masks)
+        
+        # File copies are I/O-bound, so threads overlap them well
+        workers = self.preprocess_cfg.get("aggregate_workers") or min(32, (os.cpu_count() or 1) * 4)
+        log.info(f"Placing {len(copy_jobs)} files ({mode}) using {workers} workers...")
+        with ThreadPoolExecutor(max_workers=workers) as exe:
+            list(exe.map(lambda job: place_file(*job, mode=mode), copy_jobs))
         
         log.info("")
         log.info(f"Aggregation complete:")
-        log.info(f"  Total images: {total_images}")
-        log.info(f"  Total masks: {total_masks}")
+        log.info(f"  Total images: {sum(task_image_counts)}")
+        log.info(f"  Total masks: {sum(task_mask_counts)}")
         log.info(f"  Output: {combined_images}")
         log.info("=" * 80)
         log.info("")
         
         # Store task stats in metrics
-        self.metrics["aggregated_tasks"] = task_stats
+        self.metrics["aggregated_tasks"] = [
+            {"task_name": n, "images": i, "masks": m}
+            for n, i, m in zip(task_names, task_image_counts, task_mask_counts)
+        ]
         self.metrics["total_tasks"] = len(task_dirs)
+        self._task_names = tuple(d.name for d in task_dirs)
         
         return combined_images, combined_masks
     
     def _resolve_images(
         self,
         masks_dir: Path,
-        task_names: list[str] = None
+        task_names: tuple[str, ...] | None = None
     ) -> Path:
         """
         Resolve image locations for all masks and create manifest.
@@ -265,7 +329,7 @@ class PreprocessStage:
         
         Args:
             masks_dir: Directory containing mask files
-            task_names: List of task names (for aggregated tasks)
+            task_names: Task names (for aggregated tasks)
         
         Returns:
             Path to manifest file
@@ -280,6 +344,9 @@ class PreprocessStage:
         source_cfg = self.preprocess_cfg.source
         
         if source_cfg.get("db"):
+            # Deferred so runs without DB resolution skip loading the DB layer
+            from agir_cvtoolkit.core.db import AgirDB
+            
             db_name = source_cfg.db
             db_cfg = self.cfg.db[db_name]
             
@@ -332,15 +399,13 @@ class PreprocessStage:
         # Find source data
         source_images, source_masks = self._find_source_data()
         
-        # Count source masks
-        source_mask_files = list(source_masks.glob("*.png")) + list(source_masks.glob("*_mask.png"))
-        self.metrics["source_images"] = len(source_mask_files)
-        log.info(f"Found {len(source_mask_files)} source masks")
+        # Count source masks (every *_mask.png is also a *.png, so one pass suffices)
+        num_source_masks = sum(1 for _ in _iter_images(source_masks, (".png",)))
+        self.metrics["source_images"] = num_source_masks
+        log.info(f"Found {num_source_masks} source masks")
         
         # Get task names if aggregated
-        task_names = None
-        if self.metrics["total_tasks"] > 1:
-            task_names = [t["task_name"] for t in self.metrics["aggregated_tasks"]]
+        task_names = self._task_names if self.metrics["total_tasks"] > 1 else None
         
         # Step 0: Resolve images for masks (NEW STEP)
         if self.preprocess_cfg.get("resolve_images", {}).get("enabled", True):
@@ -349,13 +414,33 @@ class PreprocessStage:
             log.info(f"Resolved {self.metrics['resolved_images']} image/mask pairs")
         
         # Create output directories
-        preprocessed_images = Path(self.paths.preprocessed) / "images"
-        preprocessed_masks = Path(self.paths.preprocessed) / "masks"
+        preprocessed_images = self.preprocessed_root / "images"
+        preprocessed_masks = self.preprocessed_root / "masks"
         preprocessed_images.mkdir(parents=True, exist_ok=True)
         preprocessed_masks.mkdir(parents=True, exist_ok=True)
         
+        # Train/val/test output directories
+        split_dirs = {
+            name: (
+                self.run_root / "train_val_test" / name / "images",
+                self.run_root / "train_val_test" / name / "masks",
+            )
+            for name in ("train", "val", "test")
+        }
+        
+        # Use seed from split config or fall back to train seed
+        seed = self.split_cfg.get('seed') or self.cfg.train.seed
+        
+        # When both steps run, write standardized outputs straight into their
+        # split directories instead of round-tripping through preprocessed/
+        fuse_split = (
+            self.do_resize
+            and self.do_split
+            and not self.preprocess_cfg.get("keep_intermediate", False)
+        )
+        
         # Step 1: Pad/Grid-Crop/Resize
-        if self.preprocess_cfg.pad_gridcrop_resize.enabled:
+        if self.do_resize:
             log.info("")
             log.info("Step 1: Standardizing image sizes (pad/grid-crop/resize)...")
             log.info("-" * 80)
@@ -367,57 +452,81 @@ class PreprocessStage:
                     source_images = resolved_images_dir
                     log.info(f"Using resolved images from: {source_images}")
             
+            sink = None
+            if fuse_split:
+                # Assign splits per source image up front (tiles follow their source)
+                stems = [os.path.splitext(e.name)[0] for e in _iter_images(source_images, _JPEG_SUFFIXES)]
+                assignment = assign_splits(stems, self.split_cfg, seed)
+                for img_d, mask_d in split_dirs.values():
+                    img_d.mkdir(parents=True, exist_ok=True)
+                    mask_d.mkdir(parents=True, exist_ok=True)
+                sink = lambda stem: split_dirs[assignment[stem]]
+            
             pad_gridcrop_resize_preprocess(
                 images_dir=source_images,
                 masks_dir=source_masks,
                 out_images=preprocessed_images,
                 out_masks=preprocessed_masks,
-                cfg=self.preprocess_cfg.pad_gridcrop_resize,
+                cfg=self.resize_cfg,
+                sink=sink,
             )
             
             # Count preprocessed images
-            preprocessed_files = list(preprocessed_images.glob("*.jpg")) + list(preprocessed_images.glob("*.png"))
-            self.metrics["preprocessed_images"] = len(preprocessed_files)
+            if fuse_split:
+                for name, (img_d, _) in split_dirs.items():
+                    self.metrics[f"{name}_samples"] = sum(1 for _ in _iter_images(img_d))
+                self.metrics["preprocessed_images"] = sum(
+                    self.metrics[f"{name}_samples"] for name in split_dirs
+                )
+            else:
+                self.metrics["preprocessed_images"] = sum(1 for _ in _iter_images(preprocessed_images))
             log.info(f"Created {self.metrics['preprocessed_images']} preprocessed images")
         else:
             log.info("Skipping pad/grid-crop/resize (disabled)")
-            # Copy source files directly
-            import shutil
-            source_image_files = list(source_images.glob("*.jpg")) + list(source_images.glob("*.JPG"))
-            for img_path in source_image_files:
-                shutil.copy2(img_path, preprocessed_images / img_path.name)
-                mask_path = source_masks / f"{img_path.stem}_mask.png"
-                if mask_path.exists():
-                    shutil.copy2(mask_path, preprocessed_masks / mask_path.name)
-            self.metrics["preprocessed_images"] = len(source_image_files)
+            # Mirror source files directly; filenames are preserved, so let
+            # copytree do the walk and only filter which entries to take
+            image_names = {e.name for e in _iter_images(source_images, _JPEG_SUFFIXES)}
+            mask_names = {f"{os.path.splitext(n)[0]}_mask.png" for n in image_names}
+            
+            def _keep_only(wanted: set[str]):
+                return lambda _dir, names: {n for n in names if n not in wanted}
+            
+            if source_images.is_dir() and source_images.resolve() != preprocessed_images.resolve():
+                shutil.copytree(
+                    source_images, preprocessed_images, dirs_exist_ok=True,
+                    copy_function=fast_copy, ignore=_keep_only(image_names),
+                )
+            if source_masks.is_dir() and source_masks.resolve() != preprocessed_masks.resolve():
+                shutil.copytree(
+                    source_masks, preprocessed_masks, dirs_exist_ok=True,
+                    copy_function=fast_copy, ignore=_keep_only(mask_names),
+                )
+            self.metrics["preprocessed_images"] = len(image_names)
         
         # Step 2: Train/Val/Test Split
-        if self.preprocess_cfg.split.enabled:
+        if self.do_split and fuse_split:
+            log.info("")
+            log.info("Step 2: Train/val/test split written during step 1")
+            log.info(
+                f"Train: {self.metrics['train_samples']}, "
+                f"Val: {self.metrics['val_samples']}, "
+                f"Test: {self.metrics['test_samples']}"
+            )
+        elif self.do_split:
             log.info("")
             log.info("Step 2: Splitting into train/val/test sets...")
             log.info("-" * 80)
             
-            # Output directories
-            train_images = self.run_root / "train_val_test" / "train" / "images"
-            train_masks = self.run_root / "train_val_test" / "train" / "masks"
-            val_images = self.run_root / "train_val_test" / "val" / "images"
-            val_masks = self.run_root / "train_val_test" / "val" / "masks"
-            test_images = self.run_root / "train_val_test" / "test" / "images"
-            test_masks = self.run_root / "train_val_test" / "test" / "masks"
-            
-            # Use seed from split config or fall back to train seed
-            seed = self.preprocess_cfg.split.get('seed') or self.cfg.train.seed
-            
             n_train, n_val, n_test = train_val_test_split(
                 images_dir=preprocessed_images,
                 masks_dir=preprocessed_masks,
-                train_images=train_images,
-                train_masks=train_masks,
-                val_images=val_images,
-                val_masks=val_masks,
-                test_images=test_images,
-                test_masks=test_masks,
-                cfg=self.preprocess_cfg.split,
+                train_images=split_dirs["train"][0],
+                train_masks=split_dirs["train"][1],
+                val_images=split_dirs["val"][0],
+                val_masks=split_dirs["val"][1],
+                test_images=split_dirs["test"][0],
+                test_masks=split_dirs["test"][1],
+                cfg=self.split_cfg,
                 seed=seed,
             )
             
@@ -428,7 +537,7 @@ class PreprocessStage:
             log.info("Skipping train/val/test split (disabled)")
         
         # Step 3: Compute Dataset Statistics
-        if self.preprocess_cfg.compute_data_stats.enabled:
+        if self.do_stats:
             log.info("")
             log.info("Step 3: Computing dataset statistics...")
             log.info("-" * 80)
@@ -440,7 +549,7 @@ class PreprocessStage:
                 stats = compute_rgb_mean_std(
                     images_dir=train_images,
                     out_file=stats_file,
-                    cfg=self.preprocess_cfg.compute_data_stats,
+                    cfg=self.stats_cfg,
                 )
                 
                 self.metrics["rgb_mean"] = stats["mean"]
@@ -451,9 +560,10 @@ class PreprocessStage:
             log.info("Skipping dataset statistics computation (disabled)")
         
         # Save metrics
-        metrics_path = Path(self.paths.metrics_path)
-        with open(metrics_path, "w") as f:
-            json.dump(self.metrics, f, indent=2)
+        write_json(self.metrics_path, self.metrics)
+        
+        # Completion manifest, written last so it only exists for finished runs
+        self._write_manifest(split_dirs)
         
         # Summary
         log.info("")
@@ -481,12 +591,42 @@ class PreprocessStage:
         log.info(f"Source masks: {self.metrics['source_images']}")
         log.info(f"Resolved pairs: {self.metrics.get('resolved_images', 0)}")
         log.info(f"Preprocessed images: {self.metrics['preprocessed_images']}")
-        if self.preprocess_cfg.split.enabled:
+        if self.do_split:
             log.info(f"Train samples: {self.metrics['train_samples']}")
             log.info(f"Val samples: {self.metrics['val_samples']}")
             log.info(f"Test samples: {self.metrics['test_samples']}")
         if self.metrics['rgb_mean']:
             log.info(f"RGB mean: {self.metrics['rgb_mean']}")
             log.info(f"RGB std: {self.metrics['rgb_std']}")
-        log.info(f"Metrics saved to: {metrics_path}")
-        log.info("=" * 80)
\ No newline at end of file
+        log.info(f"Metrics saved to: {self.metrics_path}")
+        log.info("=" * 80)
+    
+    def _write_manifest(self, split_dirs: dict[str, tuple[Path, Path]]) -> Path:
+        """
+        Atomically write the completion manifest to run_root.
+        
+        Training checks this single file (its config hash and the split
+        directories it describes) instead of scanning the split directories
+        to decide whether to re-run preprocessing.
+        
+        Args:
+            split_dirs: Split name -> (images_dir, masks_dir)
+        
+        Returns:
+            Manifest path
+        """
+        manifest = {"hash_of_config": preprocess_config_hash(self.preprocess_cfg)}
+        for name in ("train", "val"):
+            img_d, mask_d = split_dirs[name]
+            manifest[f"{name}_images_dir"] = str(img_d.resolve())
+            manifest[f"{name}_masks_dir"] = str(mask_d.resolve())
+            manifest[f"{name}_images_count"] = (
+                sum(1 for _ in _iter_images(img_d)) if img_d.is_dir() else 0
+            )
+            manifest[f"{name}_masks_count"] = (
+                sum(1 for _ in _iter_images(mask_d, (".png",))) if mask_d.is_dir() else 0
+            )
+        
+        manifest_path = write_json(self.run_root / PREPROCESS_MANIFEST, manifest, atomic=True)
+        log.info(f"Preprocess manifest saved to: {manifest_path}")
+        return manifest_path
@@ -1,15 +1,21 @@
 from __future__ import annotations
 import csv
-import json
+from datetime import datetime
+from functools import lru_cache
+from itertools import chain, islice
+from operator import itemgetter
 from pathlib import Path
-from typing import Optional, List
+from typing import Dict, Optional, List, Tuple
 
-import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from omegaconf import DictConfig
 
 from agir_cvtoolkit.core.db import AgirDB
+from agir_cvtoolkit.pipelines.utils.file_utils import dumps_json_bytes, write_json
 from agir_cvtoolkit.pipelines.utils.query_parse import _parse_repeatable_filters
 from agir_cvtoolkit.pipelines.utils.serializers import (
+    _REC_DERIVED_KEYS,
     _rec_to_dict, 
     _parse_sort, 
     _parse_sample
@@ -18,35 +24,265 @@ from agir_cvtoolkit.pipelines.utils.serializers import (
 import logging
 log = logging.getLogger(__name__)
 
-def save_records_as_dataframe(projection, out, out_path, recs_iter):
-    """Save records as CSV or Parquet."""
-    rows = [_rec_to_dict(r) for r in (recs_iter if isinstance(recs_iter, list) else list(recs_iter))]
-    df = pd.DataFrame(rows)
-    
-    if projection:
-        proj_cols = [c.strip() for c in projection.split(",") if c.strip()]
-        ordered = [c for c in proj_cols if c in df.columns] + [
-            c for c in df.columns if c not in proj_cols
-        ]
-        df = df[ordered]
-    
+@lru_cache(maxsize=128)
+def _parse_filters_cached(filters: Tuple[str, ...]) -> dict:
+    """Parse repeatable filters once per distinct filter set (see _parse_filters)."""
+    return _parse_repeatable_filters(list(filters))
+
+
+def _parse_filters(filters: Optional[List[str]]) -> dict:
+    """
+    Parse --filter arguments, reusing results for identical filter sets.
+
+    Returns a fresh top-level dict (list values copied) so callers may mutate
+    it without touching the cached entry.
+    """
+    if not filters:
+        return {}
+    parsed = _parse_filters_cached(tuple(filters))
+    return {k: list(v) if isinstance(v, list) else v for k, v in parsed.items()}
+
+
+# Rows per Arrow record batch when streaming Parquet output
+_PARQUET_BATCH_SIZE = 10_000
+
+
+# Arrow errors raised when Python values do not fit a requested type
+_ARROW_CONVERT_ERRORS = (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError)
+
+
+def _arrow_type_for(decl: str) -> pa.DataType:
+    """
+    Map a declared SQLite column type to an Arrow type using SQLite affinity rules.
+
+    NUMERIC/DECIMAL columns may hold both ints and floats, so they map to
+    float64. Declared types with no safe mapping (DATETIME, JSON, no type at
+    all) become strings; values are stringified on write.
+    """
+    if "INT" in decl:
+        return pa.int64()
+    if any(t in decl for t in ("CHAR", "CLOB", "TEXT")):
+        return pa.string()
+    if any(t in decl for t in ("REAL", "FLOA", "DOUB", "NUMERIC", "DECIMAL")):
+        return pa.float64()
+    if "BOOL" in decl:
+        return pa.bool_()
+    if "BLOB" in decl:
+        return pa.binary()
+    return pa.string()
+
+
+def _typed_array(values: list, typ: pa.DataType) -> pa.Array:
+    """pa.array(values, type=typ), except that floats never go into an integer type (Arrow truncates them)."""
+    if pa.types.is_integer(typ) and any(isinstance(v, float) for v in values):
+        raise pa.ArrowInvalid(f"float value does not fit {typ}")
+    return pa.array(values, type=typ)
+
+
+def _column_array(values: list, typ: pa.DataType) -> pa.Array:
+    """
+    Convert one column's values to an Arrow array of type typ.
+
+    String columns take str() of any value that Arrow will not convert.
+    Other columns raise one of _ARROW_CONVERT_ERRORS if a value does not
+    fit; the caller widens the column instead of dropping the value.
+    """
+    try:
+        return _typed_array(values, typ)
+    except _ARROW_CONVERT_ERRORS:
+        if not pa.types.is_string(typ):
+            raise
+    return pa.array([None if v is None else str(v) for v in values], type=typ)
+
+
+def _widened_type(typ: pa.DataType) -> pa.DataType:
+    """Next wider Parquet type for a column: integers widen to float64, everything else to string."""
+    if pa.types.is_integer(typ):
+        return pa.float64()
+    return pa.string()
+
+
+def _column_type(col: str, values: list, declared: Optional[str]) -> pa.DataType:
+    """
+    Pick a column's Parquet type from its declared DB type, else its first-batch values.
+
+    The decision is per column: a declared type that the stored values do not
+    fit (SQLite typing is advisory) falls back to inference for that column
+    only. Inference never yields the null type, which no later value could fit.
+    """
+    if declared is not None:
+        typ = _arrow_type_for(declared)
+        if pa.types.is_string(typ):
+            # Any value fits a string column (stringified by _column_array)
+            return typ
+        try:
+            _typed_array(values, typ)
+            return typ
+        except _ARROW_CONVERT_ERRORS as e:
+            log.warning(f"Column {col!r} does not fit its declared type {declared!r}, inferring instead: {e}")
+    try:
+        typ = pa.array(values).type
+    except _ARROW_CONVERT_ERRORS:
+        # Mixed Python types (e.g. ints and strings)
+        return pa.string()
+    return pa.string() if pa.types.is_null(typ) else typ
+
+
+def _arrow_table(batch: List[dict], arrow_schema: pa.Schema) -> pa.Table:
+    """
+    Build a record batch table column by column against arrow_schema.
+
+    A column whose values do not fit its type is widened (see _widened_type)
+    until they do, so no value is ever dropped; the returned table's schema
+    then differs from arrow_schema and the caller re-plans the file.
+    """
+    arrays, fields = [], []
+    for f in arrow_schema:
+        values = [r.get(f.name) for r in batch]
+        typ = f.type
+        while True:
+            try:
+                arrays.append(_column_array(values, typ))
+                break
+            except _ARROW_CONVERT_ERRORS:
+                wider = _widened_type(typ)
+                log.info(f"Column {f.name!r}: widening {typ} to {wider} to fit later values")
+                typ = wider
+        fields.append(f if typ == f.type else pa.field(f.name, typ))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def _rewrite_widened(out_path: Path, arrow_schema: pa.Schema) -> Tuple[pq.ParquetWriter, pa.Schema]:
+    """
+    Re-encode the Parquet file written so far under a widened schema.
+
+    Batches are streamed from the old file, so memory stays bounded by the
+    batch size. If old values need a still wider type the rewrite restarts
+    with it.
+
+    Returns:
+        (writer open on out_path for further batches, schema it was opened with)
+    """
+    old_path = out_path.with_name(out_path.name + ".widen")
+    out_path.replace(old_path)
+    try:
+        while True:
+            writer = pq.ParquetWriter(out_path, arrow_schema)
+            try:
+                with pq.ParquetFile(old_path) as pf:
+                    for old in pf.iter_batches(batch_size=_PARQUET_BATCH_SIZE):
+                        table = _arrow_table(old.to_pylist(), arrow_schema)
+                        if table.schema != arrow_schema:
+                            break
+                        writer.write_table(table)
+                    else:
+                        return writer, arrow_schema
+            except BaseException:
+                writer.close()
+                raise
+            writer.close()
+            arrow_schema = table.schema
+    finally:
+        old_path.unlink(missing_ok=True)
+
+
+def _ordered_columns(keys, projection: Optional[str]) -> list[str]:
+    """Put projected columns first (in projection order), then the rest."""
+    keys = list(keys)
+    if not projection:
+        return keys
+    proj_cols = [c.strip() for c in projection.split(",") if c.strip()]
+    return [c for c in proj_cols if c in keys] + [c for c in keys if c not in proj_cols]
+
+
+def save_records_as_dataframe(projection, out, out_path, recs_iter, schema: Optional[Dict[str, str]] = None):
+    """
+    Save records as CSV or Parquet.
+
+    Records are streamed: CSV rows are written one at a time and Parquet is
+    written in fixed-size batches, so memory stays bounded by the batch size.
+    Columns are the first record's keys (every row selects the same DB
+    columns) plus any derived path keys it lacks, since _rec_to_dict only
+    adds those when a row has the path; rows without a key write null.
+
+    Args:
+        projection: Comma-separated columns to put first, or None
+        out: "csv" or "parquet"
+        out_path: Output file path
+        recs_iter: Records to write
+        schema: Optional {column: declared SQLite type} (see AgirDB.schema).
+            Used to give Parquet columns explicit types instead of inferring
+            them from the first batch. Columns without one are inferred from
+            the first batch, with all-None columns written as strings.
+    """
+    rows = (_rec_to_dict(r) for r in recs_iter)
+    first = next(rows, None)
+    if first is None:
+        # Nothing matched; still produce an (empty) output file
+        if out == "csv":
+            out_path.write_text("")
+        else:
+            pq.write_table(pa.table({}), out_path)
+        return
+
+    cols = _ordered_columns(
+        chain(first.keys(), (k for k in _REC_DERIVED_KEYS if k not in first)), projection
+    )
+
     if out == "csv":
-        df.to_csv(out_path, index=False, quoting=csv.QUOTE_MINIMAL, escapechar="\\")
-    else:
-        df.to_parquet(out_path, index=False)
+        # Plain csv.writer over tuples keeps writerows in its C loop
+        # (DictWriter adds a Python-level dict-to-row step per record)
+        getter = itemgetter(*cols) if len(cols) > 1 else (lambda d: (d[cols[0]],))
+        col_set = set(cols)
+        with out_path.open("w", newline="", buffering=1 << 20) as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_MINIMAL, escapechar="\\")
+            writer.writerow(cols)
+            writer.writerows(
+                getter(r) if r.keys() >= col_set else tuple(r.get(c) for c in cols)
+                for r in chain((first,), rows)
+            )
+        return
+
+    batch = [first]
+    batch.extend(islice(rows, _PARQUET_BATCH_SIZE - 1))
+    # Types are planned from the first batch (Parquet has one schema per file).
+    # A later value that does not fit widens its column and the rows written
+    # so far are re-encoded under the wider schema, so nothing is dropped
+    arrow_schema = pa.schema([
+        pa.field(c, _column_type(c, [r.get(c) for r in batch], schema.get(c) if schema else None))
+        for c in cols
+    ])
+    writer = pq.ParquetWriter(out_path, arrow_schema)
+    try:
+        while batch:
+            table = _arrow_table(batch, arrow_schema)
+            if table.schema != arrow_schema:
+                writer.close()
+                writer, arrow_schema = _rewrite_widened(out_path, table.schema)
+                # Re-convert this batch against the re-planned schema
+                continue
+            writer.write_table(table)
+            batch = list(islice(rows, _PARQUET_BATCH_SIZE))
+    finally:
+        writer.close()
 
 def save_records_to_json(out_path: Path, recs_iter):
-    """Save records as JSON."""
-    with out_path.open("w") as f:
-        if isinstance(recs_iter, list):
-            json.dump([_rec_to_dict(r) for r in recs_iter], f, indent=2)
-        else:
-            f.write("[\n")
-            first = True
-            for r in recs_iter:
-                f.write(("" if first else ",\n") + json.dumps(_rec_to_dict(r)))
-                first = False
-            f.write("\n]\n")
+    """
+    Save records as a JSON array.
+
+    Lists and iterators take the same path: each record is converted and
+    encoded as it is written, so no second list of dicts is ever built.
+    """
+    # Stream one record at a time through a large buffer to coalesce writes
+    with out_path.open("wb", buffering=1 << 20) as f:
+        f.write(b"[\n")
+        first = True
+        for r in recs_iter:
+            if not first:
+                f.write(b",\n")
+            f.write(dumps_json_bytes(_rec_to_dict(r)))
+            first = False
+        f.write(b"\n]\n")
 
 def _save_query_spec(
     out_path: Path,
@@ -58,20 +294,16 @@ def _save_query_spec(
     offset: Optional[int],
     sample: Optional[str],
     cfg: DictConfig,
+    parsed_filters: dict,
+    parsed_sort: Optional[list],
+    parsed_sample: Optional[dict],
 ) -> None:
-    """Save the query specification to a JSON file for reproducibility."""
-    from datetime import datetime
-    
-    # Parse filters for better readability
-    from agir_cvtoolkit.pipelines.utils.query_parse import _parse_repeatable_filters
-    parsed_filters = _parse_repeatable_filters(filters or []) if filters else {}
-    
-    # Parse sort
-    parsed_sort = _parse_sort(sort) if sort else None
-    
-    # Parse sample
-    parsed_sample = _parse_sample(sample) if sample else None
+    """
+    Save the query specification to a JSON file for reproducibility.
     
+    The parsed_* arguments are the already-parsed forms of filters, sort and
+    sample from run_query, so nothing is parsed twice.
+    """
     query_spec = {
         "query_metadata": {
             "run_id": cfg['runtime']['run_id'],
@@ -110,8 +342,7 @@ def _save_query_spec(
     }
     
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(out_path, "w") as f:
-        json.dump(query_spec, f, indent=2)
+    write_json(out_path, query_spec)
     
     log.info(f"Query specification saved to: {out_path}")
 
@@ -130,98 +361,102 @@ def run_query(
 ) -> None:
     """Simplified query runner using unified AgirDB."""
     
-    # Connect to database
+    # Parse CLI arguments once; reused for the query and the saved spec
+    parsed_filters = _parse_filters(filters)
+    parsed_sort = _parse_sort(sort) if sort else None
+    parsed_sample = _parse_sample(sample) if sample else None
+    
+    # Save query specification BEFORE executing; it only needs cfg, so the
+    # database is not held open while it is written
+    if preview <= 0:
+        query_spec_path = Path(cfg['paths']['query']) / "query_spec.json"
+        _save_query_spec(
+            query_spec_path,
+            db=db,
+            filters=filters,
+            projection=projection,
+            sort=sort,
+            limit=limit,
+            offset=offset,
+            sample=sample,
+            cfg=cfg,
+            parsed_filters=parsed_filters,
+            parsed_sort=parsed_sort,
+            parsed_sample=parsed_sample,
+        )
+    
+    # Connect to database; the context manager closes it even if a step raises
     db_cfg = cfg.get("db", {}).get(db.lower())
-    agir_db = AgirDB.connect(
+    with AgirDB.connect(
         db_type=db.lower(),
         db_path=Path(db_cfg["db_path"]),
         table=db_cfg.get("table")
-    )
+    ) as agir_db:
+        # Build query using fluent interface
+        # Start with an empty builder so we always have .execute()
+        query = agir_db.builder()
     
-    # Build query using fluent interface
-    # Start with an empty builder so we always have .execute()
-    query = agir_db.builder()
-    
-    # Apply filters
-    if filters:
-        fdict = _parse_repeatable_filters(filters)
+        # Apply filters
+        if parsed_filters:
+            fdict = dict(parsed_filters)
         
-        # Handle raw expressions separately
-        raw_exprs = fdict.pop("$raw", [])
-        for expr in raw_exprs:
-            query = query.where(expr)
+            # Handle raw expressions separately
+            raw_exprs = fdict.pop("$raw", [])
+            for expr in raw_exprs:
+                query = query.where(expr)
         
-        # Apply regular filters
-        if fdict:
-            query = query.filter(**fdict)
+            # Apply regular filters
+            if fdict:
+                query = query.filter(**fdict)
     
-    # Apply projection
-    if projection:
-        cols = [c.strip() for c in projection.split(",") if c.strip()]
-        query = query.select(*cols)
+        # Apply projection
+        if projection:
+            cols = [c.strip() for c in projection.split(",") if c.strip()]
+            query = query.select(*cols)
     
-    # Apply sorting
-    if sort:
-        for col, direction in _parse_sort(sort):
-            query = query.sort(col, direction)
+        # Apply sorting
+        if parsed_sort:
+            for col, direction in parsed_sort:
+                query = query.sort(col, direction)
     
-    # Apply sampling
-    if sample:
-        sample_dict = _parse_sample(sample)
-        strategy = sample_dict.get("strategy", "").lower()
+        # Apply sampling
+        if parsed_sample:
+            sample_dict = parsed_sample
+            strategy = sample_dict.get("strategy", "").lower()
         
-        if strategy == "random":
-            query = query.sample_random(sample_dict.get("n", limit or 100))
-        elif strategy == "seeded":
-            query = query.sample_seeded(
-                sample_dict.get("n", limit or 100),
-                sample_dict.get("seed", 42)
-            )
-        elif strategy == "stratified":
-            query = query.sample_stratified(
-                by=sample_dict.get("by", []),
-                per_group=sample_dict.get("per_group", 10)
-            )
-    
-    # Apply offset
-    if offset:
-        query = query.offset(offset)
-
-    # Apply limit
-    if limit:
-        query = query.limit(limit)
-
-    # Execute query
-    if preview > 0:
-        recs = query.preview(n=preview)
-        agir_db.close()
-        return  
-    else:
-        recs = query.execute()
-
-    # Save query specification BEFORE executing
-    query_spec_path = Path(cfg['paths']['query']) / "query_spec.json"
-    _save_query_spec(
-        query_spec_path,
-        db=db,
-        filters=filters,
-        projection=projection,
-        sort=sort,
-        limit=limit,
-        offset=offset,
-        sample=sample,
-        cfg=cfg,
-    )
-    
+            if strategy == "random":
+                query = query.sample_random(sample_dict.get("n", limit or 100))
+            elif strategy == "seeded":
+                query = query.sample_seeded(
+                    sample_dict.get("n", limit or 100),
+                    sample_dict.get("seed", 42)
+                )
+            elif strategy == "stratified":
+                query = query.sample_stratified(
+                    by=sample_dict.get("by", []),
+                    per_group=sample_dict.get("per_group", 10)
+                )
     
+        # Apply offset
+        if offset:
+            query = query.offset(offset)
 
-    # Output results
-    out_path = Path(cfg['paths']['query']) / f"query.{out}"
-    
-    if out == "json":
-        save_records_to_json(out_path, recs)
-    elif out in ("csv", "parquet"):
-        save_records_as_dataframe(projection, out, out_path, recs)
-    
-    agir_db.close()
+        # Apply limit
+        if limit:
+            query = query.limit(limit)
 
+        # Execute query exactly once: preview prints a bounded sample and returns
+        if preview > 0:
+            query.preview(n=preview)
+            return
+        
+        recs = query.execute()
+        
+        # Output results
+        out_path = Path(cfg['paths']['query']) / f"query.{out}"
+        
+        if out == "json":
+            save_records_to_json(out_path, recs)
+        elif out in ("csv", "parquet"):
+            schema = agir_db.schema() if out == "parquet" else None
+            save_records_as_dataframe(projection, out, out_path, recs, schema=schema)
@@ -6,20 +6,29 @@ Usage:
 """
 from __future__ import annotations
 
+import csv
+import hashlib
 import json
 import ast
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from time import perf_counter
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import cv2
 import numpy as np
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 import torch
 from omegaconf import DictConfig
-from PIL import Image, ImageEnhance
 from tqdm import tqdm
 
 from agir_cvtoolkit.core.db import AgirDB
+from agir_cvtoolkit.pipelines.utils.file_utils import write_json
 from agir_cvtoolkit.pipelines.utils.seg_utils import (
     SegModel,
     TiledInference,
@@ -27,11 +36,160 @@ from agir_cvtoolkit.pipelines.utils.seg_utils import (
     SegVisualizer,
     load_image_from_record,
     select_available_gpus,
+    write_image,
 )
 
 import logging
 log = logging.getLogger(__name__)
 
+# Manifest CSV columns, in the order of the entries built by _process_record
+_MANIFEST_FIELDS = [
+    "record_id",
+    "image_mode",
+    "common_name",
+    "area_bin",
+    "image_path",
+    "mask_path",
+    "colorized_mask_path",
+    "cutout_path",
+    "viz_path",
+    "inference_time_ms",
+    "edge_occupancy",
+    "image_shape",
+    "mask_shape",
+    "rgb_value",
+]
+
+# Typed schema for the Parquet manifest (same columns as _MANIFEST_FIELDS)
+_MANIFEST_SCHEMA = pa.schema([
+    ("record_id", pa.string()),
+    ("image_mode", pa.string()),
+    ("common_name", pa.string()),
+    ("area_bin", pa.string()),
+    ("image_path", pa.string()),
+    ("mask_path", pa.string()),
+    ("colorized_mask_path", pa.string()),
+    ("cutout_path", pa.string()),
+    ("viz_path", pa.string()),
+    ("inference_time_ms", pa.int64()),
+    ("edge_occupancy", pa.float64()),
+    ("image_shape", pa.list_(pa.int64())),
+    ("mask_shape", pa.list_(pa.int64())),
+    ("rgb_value", pa.string()),
+])
+_MANIFEST_STR_FIELDS = [f.name for f in _MANIFEST_SCHEMA if pa.types.is_string(f.type)]
+
+
+def _rgb_tuple(rgb_value: Any) -> Optional[Tuple[int, int, int]]:
+    """
+    Normalize a 3-element color to 0-255 ints, or None if it is not one.
+    
+    Values all within 0-1 are treated as normalized and scaled by 255.
+    """
+    if not (isinstance(rgb_value, (list, tuple)) and len(rgb_value) == 3):
+        return None
+    if all(0.0 <= float(v) <= 1.0 for v in rgb_value):
+        return tuple(int(float(v) * 255) for v in rgb_value)
+    return tuple(int(v) for v in rgb_value)
+
+
+@lru_cache(maxsize=4096)
+def _parse_rgb(rgb_str: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Parse a color string like "[0.3,0.5,0.2]" or "[76,142,34]" (cached).
+    
+    Records of the same category share the string, so each distinct color is
+    parsed once per run. Returns None if the string is not a valid color.
+    """
+    try:
+        return _rgb_tuple(ast.literal_eval(rgb_str))
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+@lru_cache(maxsize=256)
+def _colorize_lut(rgb: tuple, brightness: float) -> np.ndarray:
+    """
+    (256, 3) uint8 table mapping mask value -> colorized pixel (cached, read-only).
+    
+    Reproduces PIL's Image.composite(color, black, mask) (alpha blend with
+    rounding divide-by-255) followed by ImageEnhance.Brightness (float scale,
+    clipped and truncated), so a colorized mask is one gather instead of
+    several full-size image passes.
+    """
+    m = np.arange(256, dtype=np.int64)[:, None]
+    tmp = np.asarray(rgb, dtype=np.int64)[None, :] * m + 128
+    lut = ((tmp >> 8) + tmp) >> 8
+    if brightness != 1.0:
+        lut = np.clip(lut.astype(np.float32) * np.float32(brightness), 0, 255)
+    lut = lut.astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+def _read_query_csv(path: Path) -> pa.Table:
+    """
+    Read a query CSV with pyarrow.
+    
+    Date/time-like columns are kept as strings, as pandas.read_csv would
+    leave them, so records stay JSON-serializable.
+    """
+    tbl = pa_csv.read_csv(path)
+    temporal = {f.name: pa.string() for f in tbl.schema if pa.types.is_temporal(f.type)}
+    if temporal:
+        tbl = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(column_types=temporal))
+    return tbl
+
+
+class _CsvManifestWriter:
+    """Manifest rows written through one buffered csv.DictWriter for the whole run."""
+    
+    def __init__(self, path: Path):
+        self._fh = open(path, "w", newline="", buffering=1 << 16)
+        self._writer = csv.DictWriter(self._fh, fieldnames=_MANIFEST_FIELDS)
+        self._writer.writeheader()
+    
+    def writerows(self, rows: List[Dict]) -> None:
+        self._writer.writerows(rows)
+    
+    def flush(self) -> None:
+        self._fh.flush()
+    
+    def close(self) -> None:
+        self._fh.close()
+
+
+class _ParquetManifestWriter:
+    """Manifest rows buffered and written to Parquet one row group at a time."""
+    
+    def __init__(self, path: Path, row_group_size: int = 256):
+        self._writer = pq.ParquetWriter(str(path), _MANIFEST_SCHEMA, compression="zstd")
+        self._row_group_size = row_group_size
+        self._rows: List[Dict] = []
+    
+    def writerows(self, rows: List[Dict]) -> None:
+        for row in rows:
+            # Record fields (IDs, area bins) may come back from the DB as numbers
+            for k in _MANIFEST_STR_FIELDS:
+                if row[k] is not None and not isinstance(row[k], str):
+                    row[k] = str(row[k])
+            self._rows.append(row)
+        if len(self._rows) >= self._row_group_size:
+            self._write_buffered()
+    
+    def flush(self) -> None:
+        # Parquet is only readable once closed; keep row groups full-sized
+        pass
+    
+    def close(self) -> None:
+        self._write_buffered()
+        self._writer.close()
+    
+    def _write_buffered(self) -> None:
+        if self._rows:
+            self._writer.write_table(pa.Table.from_pylist(self._rows, schema=_MANIFEST_SCHEMA))
+            self._rows = []
+
 
 class SegmentationInferenceStage:
     """
@@ -49,10 +207,21 @@ class SegmentationInferenceStage:
         
         # Setup device
         self.device = self._setup_device()
+        if self.device.type == "cuda" and self.seg_cfg.get("inference", {}).get("cudnn_benchmark", True):
+            # Tiles have a fixed shape, so cuDNN's autotuned conv algorithms are picked once and reused
+            torch.backends.cudnn.benchmark = True
+            torch.set_float32_matmul_precision("high")
 
         # Load model
         self.model = self._load_model()
         
+        # The ONNX/TensorRT graph is exported for the full padded tile size, so
+        # images smaller than a tile cannot run at their native size
+        single_tile_native = self.seg_cfg.tile.get("single_tile_native", False)
+        if single_tile_native and self.model.uses_onnxruntime:
+            log.warning("tile.single_tile_native is not supported with ONNX Runtime (fixed tile size), disabling it")
+            single_tile_native = False
+        
         # Setup inference components
         self.tiled_inference = TiledInference(
             tile_h=self.seg_cfg.tile.height,
@@ -60,6 +229,10 @@ class SegmentationInferenceStage:
             overlap=self.seg_cfg.tile.overlap,
             pad_mode=self.seg_cfg.tile.pad_mode,
             pad_divisor=self.seg_cfg.model.pad_divisor,
+            accumulator_dtype=self.seg_cfg.tile.get("accumulator_dtype", "float32"),
+            strategy=self.seg_cfg.tile.get("strategy", "uniform"),
+            min_overlap=self.seg_cfg.tile.get("min_overlap", 0.1),
+            single_tile_native=single_tile_native,
         )
         
         self.post_processor = SegPostProcessor(
@@ -72,6 +245,42 @@ class SegmentationInferenceStage:
             overlay_alpha=self.seg_cfg.visualization.overlay_alpha,
         ) if self.seg_cfg.visualization.enabled else None
         
+        # Batching: records per batched inference call, tiles per forward pass,
+        # and threads used to load a batch's images
+        infer_cfg = self.seg_cfg.get("inference", {})
+        self.batch_size = max(1, int(infer_cfg.get("batch_size", 1)))
+        self.tile_batch_size = max(1, int(infer_cfg.get("tile_batch_size", 8)))
+        self.pad_tile_batches = bool(infer_cfg.get("pad_tile_batches", True))
+        self.load_workers = max(1, int(infer_cfg.get("num_workers", 4)))
+        self.prefetch_batches = max(1, int(infer_cfg.get("prefetch_batches", 2)))
+        
+        # Output dirs and per-record settings, resolved once rather than per record
+        self._masks_dir = Path(self.paths.masks)
+        self._colorized_dir = Path(self.paths.colorized_masks)
+        self._images_dir = Path(self.paths.images)
+        self._cutouts_dir = Path(self.paths.cutouts)
+        self._plots_dir = Path(self.paths.plots)
+        for d in (self._masks_dir, self._colorized_dir, self._images_dir, self._cutouts_dir, self._plots_dir):
+            d.mkdir(parents=True, exist_ok=True)
+        self._edge_thresh = self.seg_cfg.post_process.get("edge_occupancy_threshold")
+        self._colorize_brightness = self.seg_cfg.output.get("colorize_brightness", 6.5)
+        self._cutout_use_rgba = self.seg_cfg.output.get("cutout_use_rgba", False)
+        self._image_mode = self.seg_cfg.source.get("image_mode", "cutout")
+        
+        # Image encoder for saved masks/images/cutouts ("cv2" or "pil")
+        self.image_backend = self.seg_cfg.output.get("image_backend", "cv2")
+        self.png_compression = self.seg_cfg.output.get("png_compression", 1)
+        self.jpeg_quality = self.seg_cfg.output.get("jpeg_quality", 95)
+        self.jpeg_subsampling = self.seg_cfg.output.get("jpeg_subsampling", 2)
+        
+        # Background writers for saved outputs; at most 2*io_workers writes in flight.
+        # A record's manifest row waits in _pending_records until its writes finish
+        self.io_workers = max(1, int(self.seg_cfg.output.get("io_workers", 4)))
+        self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers)
+        self._pending_records: deque = deque()
+        self._writes_in_flight = 0
+        self._ready_rows: List[Dict] = []
+        
         # Track metrics
         self.metrics = {
             "total_records": 0,
@@ -82,17 +291,21 @@ class SegmentationInferenceStage:
         }
     
     def _setup_device(self) -> torch.device:
-        """Setup GPU device."""
+        """Setup GPU device(s); sets self.device_ids to the selected GPUs (empty on CPU)."""
         gpu_cfg = self.seg_cfg.get("gpu", {})
         max_gpus = gpu_cfg.get("max_gpus", 1)
         exclude_ids = gpu_cfg.get("exclude_ids", [0])
+        self.device_ids: List[int] = []
         
         try:
+            if not torch.cuda.is_available():
+                raise RuntimeError("CUDA is not available")
+            # Select GPUs explicitly; CUDA_VISIBLE_DEVICES has no effect once torch has initialized CUDA
             device_ids = select_available_gpus(max_gpus, exclude_ids, verbose=True)
-            import os
-            os.environ["CUDA_VISIBLE_DEVICES"] = ",".join(map(str, device_ids))
-            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            log.info(f"Using device: {device}")
+            device = torch.device(f"cuda:{device_ids[0]}")
+            torch.cuda.set_device(device)
+            self.device_ids = device_ids
+            log.info(f"Using device: {device} (GPUs: {device_ids})")
             return device
         except Exception as e:
             log.warning(f"GPU setup failed: {e}, falling back to CPU")
@@ -112,6 +325,7 @@ class SegmentationInferenceStage:
             encoder_weights=model_cfg.get("encoder_weights", "imagenet"),
             mean=model_cfg.normalization.mean,
             std=model_cfg.normalization.std,
+            precision=self.seg_cfg.get("inference", {}).get("precision", "fp32"),
         )
         
         model.load_checkpoint(
@@ -120,8 +334,66 @@ class SegmentationInferenceStage:
             strict=model_cfg.get("strict_load", True),
         )
         
+        # Optionally hand the forward pass to ONNX Runtime (CUDA/TensorRT execution providers)
+        engine = self.seg_cfg.get("inference", {}).get("engine", "torch")
+        if engine in ("onnx", "trt"):
+            div = model_cfg.pad_divisor
+            input_hw = (
+                -(-self.seg_cfg.tile.height // div) * div,
+                -(-self.seg_cfg.tile.width // div) * div,
+            )
+            onnx_path = self._engine_cache_path(input_hw)
+            if model.use_onnxruntime(onnx_path, input_hw, self.device, tensorrt=engine == "trt"):
+                return model
+        elif engine != "torch":
+            raise ValueError(f"Unknown inference engine: {engine}")
+        
+        # NHWC layout for tensor-core convs (CUDA + fp16/bf16 only)
+        if self.seg_cfg.get("inference", {}).get("channels_last", False):
+            model.use_channels_last(self.device)
+        
+        # Split each tile batch across GPUs when more than one was selected
+        if len(self.device_ids) > 1:
+            model.model = torch.nn.DataParallel(model.model, device_ids=self.device_ids)
+            log.info(f"Running data-parallel inference on GPUs {self.device_ids}")
+        
+        # Optionally compile the forward pass (falls back to eager on failure)
+        elif self.seg_cfg.get("inference", {}).get("compile", False):
+            model.compile(
+                self.device,
+                mode=self.seg_cfg.inference.get("compile_mode", "reduce-overhead"),
+                fullgraph=bool(self.seg_cfg.inference.get("compile_fullgraph", False)),
+            )
+        
         return model
     
+    def _engine_cache_path(self, input_hw: tuple) -> Path:
+        """
+        Path of the cached ONNX export (TensorRT engines are cached alongside it).
+        
+        Keyed by architecture, encoder, checkpoint file (path + mtime), tile
+        shape, precision and torch version, so exports are reused across runs
+        and rebuilt whenever any of them change.
+        """
+        model_cfg = self.seg_cfg.model
+        infer_cfg = self.seg_cfg.get("inference", {})
+        cache_dir = Path(infer_cfg.get("engine_cache_dir") or Path(self.paths.out_root) / "engine_cache")
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        
+        ckpt = Path(model_cfg.ckpt_path).resolve()
+        key = "|".join(map(str, [
+            model_cfg.arch,
+            model_cfg.encoder_name,
+            model_cfg.in_channels,
+            model_cfg.num_classes,
+            ckpt,
+            ckpt.stat().st_mtime_ns,
+            input_hw,
+            infer_cfg.get("precision", "fp32"),
+            torch.__version__,
+        ]))
+        return cache_dir / f"seg_{hashlib.sha1(key.encode()).hexdigest()[:16]}.onnx"
+    
     def _get_db_records(self) -> List:
         """Get records from database query or reuse previous query results."""
         source_cfg = self.seg_cfg.source
@@ -137,16 +409,19 @@ class SegmentationInferenceStage:
                 return records
             elif query_path_csv.exists():
                 log.info(f"Loading records from previous query: {query_path_csv}")
-                df = pd.read_csv(query_path_csv)
-                if df.empty:
+                tbl = _read_query_csv(query_path_csv)
+                if tbl.num_rows == 0:
                     return []
-                log.info(f"Loaded {len(df)} records from CSV")
-                # Convert float NaNs to None for JSON serialization
-                df = df.where(pd.notnull(df), None)
-                # remove rows where bbox_xywh is NaN or empty
-                df = df[df['bbox_xywh'].notna() & (df['bbox_xywh'] != '')]
-                log.info(f"Filtered down to {len(df)} records")
-                return df.to_dict(orient="records")
+                log.info(f"Loaded {tbl.num_rows} records from CSV")
+                # remove rows where bbox_xywh is null or empty
+                bbox = tbl["bbox_xywh"]
+                keep = pc.is_valid(bbox)
+                if pa.types.is_string(bbox.type):
+                    keep = pc.and_(keep, pc.not_equal(bbox, ""))
+                tbl = tbl.filter(keep)
+                log.info(f"Filtered down to {tbl.num_rows} records")
+                # Nulls come out as None, ready for JSON serialization
+                return tbl.to_pylist()
             else:
                 raise FileNotFoundError("No previous query results found (query.json or query.csv)")
         
@@ -200,7 +475,7 @@ class SegmentationInferenceStage:
     
     def _colorize_mask(
         self, 
-        mask_path: Path, 
+        mask_u8: np.ndarray, 
         rgb_value: Any, 
         out_path: Path,
         brightness: float = 6.5
@@ -209,52 +484,30 @@ class SegmentationInferenceStage:
         Colorize a grayscale mask using the provided RGB value and save as RGB.
         
         Args:
-            mask_path: Path to the grayscale/binary mask image (nonzero = mask).
+            mask_u8: (H, W) uint8 mask (nonzero = mask; values act as alpha).
             rgb_value: list/tuple or string like "[0.3,0.5,0.2]" or "[76,142,34]".
                     Values in 0–1 will be scaled to 0–255.
             out_path: Output path for the colorized mask.
             brightness: Brightness enhancement factor (1.0 = no change, >1.0 = brighter)
         """
-        if not mask_path.exists():
-            raise FileNotFoundError(f"Mask not found: {mask_path}")
-        
-        # Load grayscale mask
-        mask_img = Image.open(mask_path).convert("L")  # ensure 8-bit grayscale
-        
-        # Parse color safely
+        # Parse color safely (strings are parsed once per distinct value)
         try:
-            if isinstance(rgb_value, str):
-                rgb_value = ast.literal_eval(rgb_value)
-            
-            if isinstance(rgb_value, (list, tuple)) and len(rgb_value) == 3:
-                # Check if values are normalized (0-1) or absolute (0-255)
-                if all(0.0 <= float(v) <= 1.0 for v in rgb_value):
-                    rgb = tuple(int(float(v) * 255) for v in rgb_value)
-                else:
-                    rgb = tuple(int(v) for v in rgb_value)
-            else:
-                log.warning(f"Invalid RGB value format: {rgb_value}, using fallback")
-                rgb = tuple(self.seg_cfg.output.get("colorize_fallback_rgb", [0, 255, 0]))
-        
+            rgb = _parse_rgb(rgb_value) if isinstance(rgb_value, str) else _rgb_tuple(rgb_value)
         except Exception as e:
             log.warning(f"Error parsing RGB value: {e}, using fallback")
+            rgb = None
+        if rgb is None:
+            log.warning(f"Invalid RGB value format: {rgb_value}, using fallback")
             rgb = tuple(self.seg_cfg.output.get("colorize_fallback_rgb", [0, 255, 0]))
         
-        # Create colored and black images
-        color_img = Image.new("RGB", mask_img.size, rgb)
-        black_img = Image.new("RGB", mask_img.size, (0, 0, 0))
-        
-        # Where mask_img > 0, take color_img; else black_img
-        colorized = Image.composite(color_img, black_img, mask_img)
-        
-        # Brighten the result for better visualization
-        if brightness != 1.0:
-            enhancer = ImageEnhance.Brightness(colorized)
-            colorized = enhancer.enhance(brightness)
+        # Color over black with the mask as alpha, brightened: one table lookup per pixel.
+        # cv2.LUT applies the per-channel table with SIMD instead of a NumPy gather
+        lut = _colorize_lut(rgb, float(brightness))
+        colorized = cv2.LUT(cv2.cvtColor(mask_u8, cv2.COLOR_GRAY2RGB), lut.reshape(256, 1, 3))
         
         # Save colorized mask
         out_path.parent.mkdir(parents=True, exist_ok=True)
-        colorized.save(out_path)
+        write_image(out_path, colorized, backend=self.image_backend, png_compression=self.png_compression)
         log.debug(f"Saved colorized mask to: {out_path}")
 
 
@@ -289,148 +542,152 @@ class SegmentationInferenceStage:
 
 
     
+    def _resolve_record(self, record: Dict, seen_ids: set) -> Optional[tuple]:
+        """Resolve a record's ID and image mode, skipping already-queued full images.
+        
+        Args:
+            record: Database record
+            seen_ids: Full-image record IDs already queued this run (updated)
+        
+        Returns:
+            (record_id, image_mode), or None if skipped"""
+        image_mode = self._image_mode
+        record_id = record["_record_id"]
+
+        if image_mode == "full_image":
+            if record_id in seen_ids:
+                log.info(f"Skipping record {record_id} - already processed in full_image mode")
+                self.metrics["skipped"] += 1
+                return None
+            seen_ids.add(record_id)
+            log.info(f"Processing record {record_id} in full_image mode")
+        
+        return record_id, image_mode
+    
+    def _precompute_record_keys(self, records: List[Dict]) -> None:
+        """Resolve each record's output ID and normalized common name once, up front.
+        
+        Adds "_record_id" (image ID in full_image mode, cutout ID otherwise)
+        and "_common_name_norm" (lowercase, underscores) to every record."""
+        id_field = "image_id" if self._image_mode == "full_image" else "cutout_id"
+        for record in records:
+            record["_record_id"] = record.get(id_field, record.get("id", "unknown"))
+            common_name = record.get("category_common_name", record.get("common_name", "unknown"))
+            record["_common_name_norm"] = (common_name or "unknown").lower().replace(" ", "_")
+    
+    def _load_image(self, record: Dict, image_mode: str) -> tuple:
+        """Load a record's image; safe to call from worker threads.
+        
+        Returns:
+            (img_rgb_u8 or None, error or None)"""
+        try:
+            return load_image_from_record(record, self.cfg, image_mode=image_mode), None
+        except Exception as e:
+            return None, e
+    
     def _process_record(
         self,
         record: Dict,
-        manifest: pd.DataFrame,
+        record_id: str,
+        image_mode: str,
+        img_rgb_u8: np.ndarray,
+        pred_mask: np.ndarray,
+        inference_time_ms: int,
         save_mask: bool,
         save_image: bool,
         save_cutout: bool,
         save_viz: bool,
         save_colorized: bool,
-    ) -> Optional[Dict]:
-        """Process a single database record through the inference pipeline.
+    ) -> None:
+        """Post-process and save the outputs for one record whose mask has been predicted.
+        
+        Writes are queued on the I/O pool; the record's manifest row is staged
+        (and the record counted) only once they finish, see _finish_record.
         
         Args:
             record: Database record
+            record_id: Record ID used for output filenames
+            image_mode: "cutout" or "full_image"
+            img_rgb_u8: Source image (H, W, 3) as uint8
+            pred_mask: Predicted mask (H, W) as uint8
+            inference_time_ms: Inference time attributed to this record
             save_mask: Whether to save the predicted mask
             save_image: Whether to save the source image
             save_cutout: Whether to save the masked cutout
             save_viz: Whether to save visualization
-            save_colorized: Whether to save colorized mask
-        
-        Returns:
-            Manifest entry dict, or None if skipped/failed"""
+            save_colorized: Whether to save colorized mask"""
         try:
-            # Get image_mode from config
-            image_mode = self.seg_cfg.source.get("image_mode", "cutout")
-
-            if image_mode == "full_image":
-                record_id = record.get("image_id", record.get("id", "unknown"))
-                if record_id in list(manifest['record_id'].unique()):
-                    log.info(f"Skipping record {record_id} - already processed in full_image mode")
-                    self.metrics["skipped"] += 1
-                    return None
-                else:
-                    log.info(f"Processing record {record_id} in full_image mode")
-            else:
-                record_id = record.get("cutout_id", record.get("id", "unknown"))
-
-            # Load image
-            img_rgb_u8 = load_image_from_record(record, self.cfg, image_mode=image_mode)
-
-            if img_rgb_u8 is None:
-                log.warning(f"Could not load image for record {record.get('cutout_id', 'unknown')}")
-                self.metrics["skipped"] += 1
-                return None
-            
-            # Run inference
-            t0 = perf_counter()
-
-            if image_mode == "full_image":
-                record_id = record.get("image_id", record_id)
-                log.debug(f"Running inference on FULL IMAGE for record {record_id}...")
-            else:
-                log.debug(f"Running inference on CUTOUT for record {record_id}...")
-
-            pred_mask = self.tiled_inference.predict(
-                img_rgb_u8=img_rgb_u8,
-                model=self.model,
-                device=self.device,
-            )
-            inference_time_ms = int((perf_counter() - t0) * 1000)
-            
             # Post-process
             log.debug(f"Post-processing mask...")
-            pred_mask, edge_occupancy = self.post_processor.process(pred_mask, class_id=record.get("category_class_id", 27))
+            pred_mask, edge_occupancy = self.post_processor.process(
+                pred_mask, class_id=record.get("category_class_id", 27), remapped=True
+            )
             
             # Determine if we should skip based on edge occupancy
             log.debug(f"Edge occupancy: {edge_occupancy:.3f}")
-            edge_thresh = self.seg_cfg.post_process.get("edge_occupancy_threshold")
+            edge_thresh = self._edge_thresh
             if edge_thresh is not None and edge_occupancy > edge_thresh:
                 log.info(
                     f"Skipping {record.get('cutout_id', 'unknown')} - "
                     f"edge occupancy {edge_occupancy:.3f} > {edge_thresh}"
                 )
                 self.metrics["skipped"] += 1
-                return None
+                return
             
             # Get output paths
-            common_name = record.get("category_common_name", record.get("common_name", "unknown"))
-            common_name = common_name.lower().replace(" ", "_")
+            common_name = record["_common_name_norm"]
             area_bin = record.get("area_bin", "")
             
-            # Save outputs
-            if save_mask:
-                mask_path = Path(self.paths.masks) / f"{record_id}.png"
-                mask_path.parent.mkdir(parents=True, exist_ok=True)
-                log.debug(f"Saving mask to: {mask_path}")
-                Image.fromarray(pred_mask, mode="L").save(mask_path)
-
-            # Save colorized mask
+            # Save outputs (encoded and written on background threads)
+            writes = []
             colorized_path = None
             rgb_value = None
-            if save_colorized and save_mask:
-                mask_path = Path(self.paths.masks) / f"{record_id}.png"
-                colorized_path = Path(self.paths.colorized_masks) / f"{record_id}.png"
-                
-                # Get RGB value from record
+            mask_path = self._masks_dir / f"{record_id}.png"
+            img_path = self._images_dir / f"{record_id}.jpg"
+            cutout_path = self._cutouts_dir / f"{record_id}.png"
+            if save_mask:
+                log.debug(f"Saving mask to: {mask_path}")
+                writes.append(("mask_path", self._submit_write(
+                    write_image, mask_path, pred_mask, backend=self.image_backend, png_compression=self.png_compression
+                )))
+            
+            # Colorized from the in-memory mask, so it doesn't depend on the grayscale PNG
+            if save_colorized:
+                colorized_path = self._colorized_dir / f"{record_id}.png"
                 rgb_value = self._get_rgb_from_record(record)
-                
-                # Get brightness factor
-                brightness = self.seg_cfg.output.get("colorize_brightness", 6.5)
-                
-                # Colorize and save
-                try:
-                    self._colorize_mask(
-                        mask_path=mask_path,
-                        rgb_value=rgb_value,
-                        out_path=colorized_path,
-                        brightness=brightness
-                    )
-                    log.debug(f"Saved colorized mask: {colorized_path}")
-                except Exception as e:
-                    log.error(f"Failed to colorize mask: {e}")
-                    colorized_path = None
+                writes.append(("colorized_mask_path", self._submit_write(
+                    self._write_colorized, pred_mask, rgb_value, colorized_path, self._colorize_brightness
+                )))
             
             if save_image:
-                img_path = Path(self.paths.images) / f"{record_id}.jpg"
-                img_path.parent.mkdir(parents=True, exist_ok=True)
                 log.debug(f"Saving image to: {img_path}")
                 # Save the high-res jpg
-                Image.fromarray(img_rgb_u8, mode="RGB").save(img_path, format="JPEG", quality=100, subsampling=0, optimize=False)
+                writes.append(("image_path", self._submit_write(
+                    write_image,
+                    img_path,
+                    img_rgb_u8,
+                    backend=self.image_backend,
+                    jpeg_quality=self.jpeg_quality,
+                    jpeg_subsampling=self.jpeg_subsampling,
+                )))
 
             if save_cutout:
-                use_rgba = self.seg_cfg.output.get("cutout_use_rgba", False)
-                cutout_path = Path(self.paths.cutouts) / f"{record_id}.png"
-                cutout_path.parent.mkdir(parents=True, exist_ok=True)
                 log.debug(f"Saving cutout to: {cutout_path}")
-                self._save_cutout(img_rgb_u8, pred_mask, cutout_path, use_rgba=use_rgba)
+                writes.append(("cutout_path", self._submit_write(
+                    self._save_cutout, img_rgb_u8, pred_mask, cutout_path, use_rgba=self._cutout_use_rgba
+                )))
             
             if save_viz and self.visualizer:
-                viz_path = Path(self.paths.plots) / f"area_{area_bin}_{record_id}_viz.png"
-                viz_path.parent.mkdir(parents=True, exist_ok=True)
+                viz_path = self._plots_dir / f"area_{area_bin}_{record_id}_viz.png"
                 log.debug(f"Saving visualization to: {viz_path}")
-                self.visualizer.plot_quad(
+                writes.append(("viz_path", self._submit_write(
+                    self.visualizer.plot_quad,
                     record=record,
                     img_rgb_u8=img_rgb_u8,
                     pred_mask=pred_mask,
                     out_path=viz_path,
                     edge_occupancy=edge_occupancy,
-                )
-            
-            self.metrics["processed"] += 1
-            self.metrics["total_inference_time_ms"] += inference_time_ms
+                )))
             
             # Build manifest entry
             manifest_entry = {
@@ -438,26 +695,177 @@ class SegmentationInferenceStage:
                 "image_mode": image_mode,  # Track which mode was used
                 "common_name": common_name,
                 "area_bin": area_bin,
-                "image_path": str(Path(self.paths.images) / f"{record_id}.jpg") if save_image else None,
-                "mask_path": str(Path(self.paths.masks) / f"{record_id}.png") if save_mask else None,
+                "image_path": str(img_path) if save_image else None,
+                "mask_path": str(mask_path) if save_mask else None,
                 "colorized_mask_path": str(colorized_path) if colorized_path else None,
-                "cutout_path": str(Path(self.paths.cutouts) / f"{record_id}.png") if save_cutout else None,
-                "viz_path": str(Path(self.paths.plots) / f"{record_id}_viz.png") if save_viz else None,
+                "cutout_path": str(cutout_path) if save_cutout else None,
+                "viz_path": str(self._plots_dir / f"{record_id}_viz.png") if save_viz else None,
                 "inference_time_ms": inference_time_ms,
                 "edge_occupancy": float(edge_occupancy),
                 "image_shape": list(img_rgb_u8.shape),
                 "mask_shape": list(pred_mask.shape),
                 "rgb_value": str(rgb_value) if save_colorized else None,
             }
-            self.metrics["processed"] += 1
-            self.metrics["total_inference_time_ms"] += inference_time_ms
-            
-            return manifest_entry
+            self._queue_record(manifest_entry, writes)
         
         except Exception as e:
             log.error(f"Failed to process record {record_id}: {e}")
             self.metrics["failed"] += 1
-            return None
+    
+    def _write_colorized(
+        self,
+        pred_mask: np.ndarray,
+        rgb_value: Any,
+        colorized_path: Path,
+        brightness: float,
+    ) -> None:
+        """Write the colorized version of a mask (runs on an I/O thread)."""
+        self._colorize_mask(
+            mask_u8=pred_mask,
+            rgb_value=rgb_value,
+            out_path=colorized_path,
+            brightness=brightness
+        )
+        log.debug(f"Saved colorized mask: {colorized_path}")
+    
+    def _submit_write(self, fn, *args, **kwargs) -> Future:
+        """Queue one output write on the I/O pool."""
+        return self._io_pool.submit(fn, *args, **kwargs)
+    
+    def _queue_record(self, entry: Dict, writes: List[tuple]) -> None:
+        """Hold a record's manifest entry until its (field, future) writes finish.
+        
+        Blocks on the oldest records while more than 2*io_workers writes are in flight."""
+        self._pending_records.append((entry, writes))
+        self._writes_in_flight += len(writes)
+        while self._writes_in_flight > 2 * self.io_workers:
+            self._finish_record(*self._pending_records.popleft())
+    
+    def _finish_record(self, entry: Dict, writes: List[tuple]) -> None:
+        """Wait for one record's writes, then count it and stage its manifest row.
+        
+        A failed colorized mask only nulls its path; any other failed write
+        fails the record, which is then left out of the manifest."""
+        self._writes_in_flight -= len(writes)
+        ok = True
+        for field, fut in writes:
+            try:
+                fut.result()
+            except Exception as e:
+                log.error(f"Failed to write {field} for record {entry['record_id']}: {e}")
+                if field == "colorized_mask_path":
+                    entry[field] = None
+                else:
+                    ok = False
+        if not ok:
+            self.metrics["failed"] += 1
+            return
+        self.metrics["processed"] += 1
+        self.metrics["total_inference_time_ms"] += entry["inference_time_ms"]
+        self._ready_rows.append(entry)
+    
+    def _reap_writes(self, block: bool = False) -> List[Dict]:
+        """Finish queued records in order and return the manifest rows ready to write.
+        
+        Args:
+            block: Wait for every queued record; otherwise stop at the first
+                record whose writes are still running"""
+        while self._pending_records and (
+            block or all(fut.done() for _, fut in self._pending_records[0][1])
+        ):
+            self._finish_record(*self._pending_records.popleft())
+        rows, self._ready_rows = self._ready_rows, []
+        return rows
+    
+    def _drain_writes(self) -> List[Dict]:
+        """Wait for all queued writes, stop the I/O pool and return the remaining manifest rows."""
+        rows = self._reap_writes(block=True)
+        self._io_pool.shutdown(wait=True)
+        return rows
+    
+    def _submit_batch(
+        self,
+        loader: ThreadPoolExecutor,
+        records: List[Dict],
+        seen_ids: set,
+    ) -> List[tuple]:
+        """Resolve a batch's record IDs and start loading its images in the background.
+        
+        Args:
+            loader: Thread pool used for image loading
+            records: Database records in this batch
+            seen_ids: Full-image record IDs already queued this run
+        
+        Returns:
+            Pending (record, record_id, image_mode, future) tuples"""
+        pending = []
+        for record in records:
+            resolved = self._resolve_record(record, seen_ids)
+            if resolved is not None:
+                record_id, image_mode = resolved
+                pending.append((record, record_id, image_mode, loader.submit(self._load_image, record, image_mode)))
+        return pending
+    
+    def _collect_batch(self, pending: List[tuple]) -> List[tuple]:
+        """Wait for a batch's images and drop the ones that failed to load.
+        
+        Returns:
+            (record, record_id, image_mode, img_rgb_u8) tuples ready for inference"""
+        batch = []
+        for record, record_id, image_mode, fut in pending:
+            img_rgb_u8, err = fut.result()
+            if err is not None:
+                log.error(f"Failed to process record {record_id}: {err}")
+                self.metrics["failed"] += 1
+            elif img_rgb_u8 is None:
+                log.warning(f"Could not load image for record {record.get('cutout_id', 'unknown')}")
+                self.metrics["skipped"] += 1
+            else:
+                batch.append((record, record_id, image_mode, img_rgb_u8))
+        return batch
+    
+    def _infer_batch(self, batch: List[tuple], **save_flags: bool) -> None:
+        """Run one batched tiled inference over loaded records, then queue their outputs.
+        
+        Args:
+            batch: (record, record_id, image_mode, img_rgb_u8) tuples
+            **save_flags: save_mask/save_image/save_cutout/save_viz/save_colorized"""
+        if not batch:
+            return
+        
+        # Run inference on the whole batch
+        t0 = perf_counter()
+        try:
+            # Class remap is fused into the on-device threshold
+            fg_values = [
+                self.post_processor.foreground_value(record.get("category_class_id", 27))
+                for record, _, _, _ in batch
+            ]
+            pred_masks = self.tiled_inference.predict_batch(
+                imgs_rgb_u8=[img for _, _, _, img in batch],
+                model=self.model,
+                device=self.device,
+                tile_batch_size=self.tile_batch_size,
+                pad_last_batch=self.pad_tile_batches,
+                fg_values=fg_values,
+            )
+        except Exception as e:
+            log.error(f"Batched inference failed for {len(batch)} records: {e}")
+            self.metrics["failed"] += len(batch)
+            return
+        # Attribute batch time evenly to its records
+        inference_time_ms = int((perf_counter() - t0) * 1000 / len(batch))
+        
+        for (record, record_id, image_mode, img_rgb_u8), pred_mask in zip(batch, pred_masks):
+            self._process_record(
+                record=record,
+                record_id=record_id,
+                image_mode=image_mode,
+                img_rgb_u8=img_rgb_u8,
+                pred_mask=pred_mask,
+                inference_time_ms=inference_time_ms,
+                **save_flags,
+            )
     
     def _save_cutout(
         self,
@@ -488,9 +896,19 @@ class SegmentationInferenceStage:
         m = pred_mask
         if m.dtype == np.bool_:
             alpha = m.astype(np.uint8) * 255
+        elif m.dtype == np.uint8:
+            # Common case (post-processed masks): same scaling rules as the float
+            # path below, applied through a 256-entry lookup table in one pass
+            m_max = int(m.max())
+            if m_max in (0, 255):
+                alpha = m
+            else:
+                scale = 255.0 if m_max <= 1 else 255.0 / m_max
+                lut = (np.arange(256, dtype=np.float32) * scale).clip(0, 255).round().astype(np.uint8)
+                alpha = lut[m]
         else:
             m = m.astype(np.float32)  # safe cast
-            m_min, m_max = float(np.min(m)), float(np.max(m))
+            m_max = float(np.max(m))
             if m_max <= 1.0:          # e.g., 0/1 or [0,1]
                 alpha = (m * 255.0).round().astype(np.uint8)
             elif m_max <= 255.0:      # already looks like 0..255 (possibly 10..40 etc.)
@@ -502,32 +920,24 @@ class SegmentationInferenceStage:
                     alpha = m.clip(0, 255).round().astype(np.uint8)
             else:
                 # Unexpected scale; normalize to [0,255]
+                m_min = float(np.min(m))
                 alpha = ((m - m_min) / max(1e-6, (m_max - m_min)) * 255.0).round().astype(np.uint8)
 
         if hard_binary:
             alpha = (alpha >= thresh).astype(np.uint8) * 255
 
-        cutout_path.parent.mkdir(parents=True, exist_ok=True)
+        # Black out pixels outside the mask in one SIMD pass (nonzero alpha keeps the pixel)
+        # (also wipes RGB under fully transparent alpha to avoid halos in some viewers)
+        masked = cv2.bitwise_and(img_rgb_u8, img_rgb_u8, mask=alpha)
 
         if use_rgba:
             # RGBA with STRAIGHT (un-premultiplied) alpha
-            rgba = np.zeros((h, w, 4), dtype=np.uint8)
-            rgba[:, :, :3] = img_rgb_u8
-            rgba[:, :, 3] = alpha
-
-            # Optional: wipe RGB where fully transparent to avoid halos in some viewers
-            fully_transparent = (alpha == 0)
-            if np.any(fully_transparent):
-                rgba[fully_transparent, :3] = 0
-
-            Image.fromarray(rgba, mode="RGBA").save(cutout_path, format="PNG")
+            rgba = np.dstack((masked, alpha))
+            write_image(cutout_path, rgba, backend=self.image_backend, png_compression=self.png_compression)
 
         else:
             # RGB with black background (no alpha)
-            masked = np.zeros_like(img_rgb_u8, dtype=np.uint8)
-            vis = alpha > 0
-            masked[vis] = img_rgb_u8[vis]
-            Image.fromarray(masked, mode="RGB").save(cutout_path, format="PNG")
+            write_image(cutout_path, masked, backend=self.image_backend, png_compression=self.png_compression)
     
     def run(self) -> None:
         """Run the segmentation inference pipeline."""
@@ -541,6 +951,7 @@ class SegmentationInferenceStage:
             log.warning("No records to process.")
             return
         
+        self._precompute_record_keys(records)
         self.metrics["total_records"] = len(records)
         log.info(f"Processing {len(records)} records...")
         
@@ -552,53 +963,83 @@ class SegmentationInferenceStage:
         save_viz = output_cfg.get("save_viz", False)
         save_colorized = output_cfg.get("save_colorized_masks", False)
         
-        manifest_path = Path(self.paths.manifest_path)
-        manifest_path = manifest_path.with_suffix('.csv')  # Ensure .csv extension
-        
-        # Initialize CSV with header
+        # Open the manifest once for the whole run ("parquet" or "csv")
+        manifest_format = output_cfg.get("manifest_format", "parquet")
+        manifest_path = Path(self.paths.manifest_path).with_suffix(f".{manifest_format}")
         manifest_path.parent.mkdir(parents=True, exist_ok=True)
-        df = pd.DataFrame(columns=[
-            'record_id',
-            'common_name',
-            'edge_occupancy',
-            'inference_time_ms',
-            'mask_path',
-            'image_path',
-            'plot_path',
-        ])
-        df.to_csv(manifest_path, index=False)
-
-        # Metrics update interval
-        metrics_update_interval = 10
+        if manifest_format == "parquet":
+            manifest_writer = _ParquetManifestWriter(
+                manifest_path, row_group_size=output_cfg.get("manifest_row_group_size", 256)
+            )
+        elif manifest_format == "csv":
+            manifest_writer = _CsvManifestWriter(manifest_path)
+        else:
+            raise ValueError(f"Unknown manifest format: {manifest_format}")
+        # Drop the other format's manifest (the empty manifest.csv placeholder
+        # created at run setup, or a stale file from an earlier run), so
+        # readers such as cvat-upload never pick it up instead of this one
+        other_format = "csv" if manifest_format == "parquet" else "parquet"
+        manifest_path.with_suffix(f".{other_format}").unlink(missing_ok=True)
+
+        # Progress snapshots (metrics + manifest flush) are time-based, not per-N records
+        metrics_flush_s = float(self.seg_cfg.output.get("metrics_flush_s", 60))
         metrics_path = Path(self.paths.metrics_path)
-        result : Dict[str, Any] = {}
-        # Process records and write to CSV in real-time
-        for idx, record in enumerate(tqdm(records, desc="Inference"), 1):
-            result = self._process_record(
-                record=record,
-                manifest=df,
-                save_mask=save_mask,
-                save_image=save_image,
-                save_cutout=save_cutout,
-                save_viz=save_viz,
-                save_colorized=save_colorized,
+        # Absorb compile/autotune cost outside the timed loop. Only worth it when
+        # there is work and something to warm (compiled graphs, cuDNN autotune);
+        # on CPU a full dummy tile batch is pure overhead
+        if records and (self.model.is_compiled or self.device.type == "cuda"):
+            self.model.warmup(
+                tile_hw=(self.tiled_inference.tile_h, self.tiled_inference.tile_w),
+                batch_size=self.tile_batch_size,
+                device=self.device,
+                pad_divisor=self.tiled_inference.pad_divisor,
             )
-            
-            if result:
-                # Create a one-row DataFrame for the result and append to CSV without using deprecated .append
-                new_row = pd.DataFrame([result])
-                new_row.to_csv(manifest_path, mode='a', header=False, index=False)
-                # Update the in-memory dataframe using pd.concat
-                df = pd.concat([df, new_row], ignore_index=True)
-
-            # Update metrics periodically
-            if idx % metrics_update_interval == 0:
-                self.metrics["avg_inference_time_ms"] = (
-                    self.metrics["total_inference_time_ms"] / self.metrics["processed"]
-                    if self.metrics["processed"] > 0 else 0
+        
+        seen_ids: set = set()
+        batches = [records[i:i + self.batch_size] for i in range(0, len(records), self.batch_size)]
+        save_flags = dict(
+            save_mask=save_mask,
+            save_image=save_image,
+            save_cutout=save_cutout,
+            save_viz=save_viz,
+            save_colorized=save_colorized,
+        )
+        
+        # Prefetch pipeline: up to prefetch_batches batches load in the background
+        # while batch N runs on the GPU; manifest rows are written once a record's outputs are saved
+        pbar = tqdm(total=len(records), desc="Inference")
+        last_metrics_flush = perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.load_workers) as loader:
+                in_flight = deque(
+                    self._submit_batch(loader, b, seen_ids) for b in batches[:self.prefetch_batches]
                 )
-                with open(metrics_path, "w") as f:
-                    json.dump(self.metrics, f, indent=2)
+                for b_idx, batch_records in enumerate(batches):
+                    batch = self._collect_batch(in_flight.popleft())
+                    if b_idx + self.prefetch_batches < len(batches):
+                        in_flight.append(
+                            self._submit_batch(loader, batches[b_idx + self.prefetch_batches], seen_ids)
+                        )
+                    
+                    self._infer_batch(batch, **save_flags)
+                    pbar.update(len(batch_records))
+                    
+                    # Buffered; flushed with the periodic metrics update below
+                    manifest_writer.writerows(self._reap_writes())
+                    
+                    # Update metrics periodically
+                    if perf_counter() - last_metrics_flush >= metrics_flush_s:
+                        last_metrics_flush = perf_counter()
+                        manifest_writer.flush()
+                        self.metrics["avg_inference_time_ms"] = (
+                            self.metrics["total_inference_time_ms"] / self.metrics["processed"]
+                            if self.metrics["processed"] > 0 else 0
+                        )
+                        write_json(metrics_path, self.metrics, atomic=True)
+        finally:
+            manifest_writer.writerows(self._drain_writes())
+            manifest_writer.close()
+            pbar.close()
         
         # Final metrics update
         self.metrics["avg_inference_time_ms"] = (
@@ -606,8 +1047,7 @@ class SegmentationInferenceStage:
             if self.metrics["processed"] > 0 else 0
         )
         
-        with open(metrics_path, "w") as f:
-            json.dump(self.metrics, f, indent=2)
+        write_json(metrics_path, self.metrics, atomic=True)
         
         # Summary
         log.info("=" * 80)
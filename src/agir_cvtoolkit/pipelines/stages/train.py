@@ -15,28 +15,57 @@ from __future__ import annotations
 
 import json
 import logging
+import os
+from functools import cached_property
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, List, Optional
 
 import torch
-from omegaconf import DictConfig
-from pytorch_lightning import Trainer
-from pytorch_lightning.callbacks import ModelCheckpoint, EarlyStopping
-from pytorch_lightning.loggers import Logger
-from torch.utils.data import DataLoader
+from omegaconf import DictConfig, OmegaConf
 
-from agir_cvtoolkit.pipelines.utils.train_utils import (
-    LitSegmentation,
-    FieldDataset,
-    get_batch_collate_fn,
-    set_seed,
-    seed_worker,
-    select_available_gpus,
-)
+from agir_cvtoolkit.pipelines.utils.file_utils import write_json
+
+# Lightning, hydra and train_utils are imported where used, so importing this
+# module (e.g. for CLI dispatch) stays cheap
+if TYPE_CHECKING:
+    from pytorch_lightning.loggers import Logger
+    from agir_cvtoolkit.pipelines.utils.train_utils import LitSegmentation
+
+__all__ = ["TrainingStage"]
 
 log = logging.getLogger(__name__)
 
 
+def _nonempty(path: Path) -> bool:
+    """Whether a directory has any entry (reads a single dirent, no Path objects)."""
+    with os.scandir(path) as it:
+        return next(it, None) is not None
+
+
+def _compile_repeated_blocks(module: torch.nn.Module, **compile_kwargs) -> int:
+    """
+    Compile, in place, each block of every container holding repeated blocks.
+    
+    A container is an nn.Sequential/nn.ModuleList whose children all share one
+    class (ResNet layerN, EfficientNet blocks, transformer stages). Same-class
+    blocks hit Dynamo's cache after the first, so this compiles much faster
+    than the whole model. nn.Module.compile keeps state_dict keys unchanged.
+    
+    Returns:
+        Number of blocks compiled
+    """
+    children = list(module.children())
+    if (
+        isinstance(module, (torch.nn.Sequential, torch.nn.ModuleList))
+        and len(children) > 1
+        and len({type(c) for c in children}) == 1
+    ):
+        for block in children:
+            block.compile(**compile_kwargs)
+        return len(children)
+    return sum(_compile_repeated_blocks(c, **compile_kwargs) for c in children)
+
+
 class TrainingStage:
     """Training stage for segmentation models."""
     
@@ -54,6 +83,13 @@ class TrainingStage:
             "best_val_loss": None,
             "best_checkpoint": None,
         }
+        
+        # GPU IDs chosen by _setup_device (None = let Lightning pick)
+        self._device_ids: Optional[List[int]] = None
+    
+    def _sel(self, key: str, default=None):
+        """Look up a dotted key in the train config in one walk, e.g. _sel("compile.mode", "default")."""
+        return OmegaConf.select(self.train_cfg, key, default=default)
     
     def _run_preprocessing_if_needed(self) -> None:
         """Run preprocessing if enabled and data not already processed."""
@@ -61,9 +97,14 @@ class TrainingStage:
             log.info("Auto-preprocessing disabled, assuming data is ready")
             return
         
-        # Check if preprocessed data already exists
+        # A matching completion manifest answers "is preprocessing done?" in one read
+        if self._preprocess_manifest_valid():
+            log.info("Preprocess manifest matches config, skipping preprocessing")
+            return
+        
+        # No manifest (e.g. data prepared by hand): fall back to probing the directory
         train_images = Path(self.train_cfg.train_images_dir)
-        if train_images.exists() and any(train_images.iterdir()):
+        if train_images.exists() and _nonempty(train_images):
             log.info("Preprocessed training data found, skipping preprocessing")
             return
         
@@ -85,23 +126,60 @@ class TrainingStage:
         log.info("Preprocessing complete, continuing to training...")
         log.info("")
     
+    def _preprocess_manifest_valid(self) -> bool:
+        """
+        Whether run_root holds a preprocess manifest that vouches for the configured data.
+        
+        The manifest must have been written with the current preprocess config
+        and describe the same train/val image and mask directories that
+        training reads; otherwise callers fall back to probing the directories.
+        """
+        if not hasattr(self.cfg, "preprocess"):
+            return False
+        
+        from agir_cvtoolkit.pipelines.stages.preprocess import (
+            PREPROCESS_MANIFEST,
+            preprocess_config_hash,
+        )
+        
+        try:
+            with open(self.run_root / PREPROCESS_MANIFEST) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        
+        if manifest.get("hash_of_config") != preprocess_config_hash(self.cfg.preprocess):
+            log.info("Preprocess config changed since the last run")
+            return False
+        for key in ("train_images_dir", "train_masks_dir", "val_images_dir", "val_masks_dir"):
+            if manifest.get(key) != str(Path(self.train_cfg[key]).resolve()):
+                log.info(f"Preprocess manifest does not describe the configured {key}")
+                return False
+        return manifest.get("train_images_count", 0) > 0 and manifest.get("val_images_count", 0) > 0
+    
     def run(self) -> None:
         """Run the training pipeline."""
         log.info("=" * 80)
         log.info("Starting Training Pipeline")
         log.info("=" * 80)
         
+        # Fresh loggers for each run
+        self.__dict__.pop("_loggers", None)
+        
         # Run preprocessing if needed
         self._run_preprocessing_if_needed()
         
+        from agir_cvtoolkit.pipelines.utils.train_utils import BestCheckpointStep, LitSegmentation, set_seed
+        
         # Set seed for reproducibility
         set_seed(self.train_cfg.seed)
         
         # Setup device
-        self._setup_device()
+        self._device_ids = self._setup_device()
         
-        # Verify data paths exist
-        self._verify_data_paths()
+        # Verify data paths exist (a valid preprocess manifest already vouches for them)
+        if self.train_cfg.get("deep_verify", False) or not self._preprocess_manifest_valid():
+            self._verify_data_paths()
         
         # Create datasets
         train_ds, val_ds = self._create_datasets()
@@ -112,23 +190,28 @@ class TrainingStage:
         train_loader, val_loader = self._create_dataloaders(train_ds, val_ds)
         
         # Visualize data if enabled
-        if self.train_cfg.get("dataloader_visualizer", {}).get("enabled", False):
+        if self._sel("dataloader_visualizer.enabled", False):
             self._visualize_dataloader(train_loader)
         
-        if self.train_cfg.get("augmentation_visualizer", {}).get("enabled", False):
+        if self._sel("augmentation_visualizer.enabled", False):
             self._visualize_augmentations(train_loader)
         
         # Create model
         model = LitSegmentation(self.cfg)
+        model = self._maybe_compile(model)
         
-        # Create loggers
-        loggers = self._create_loggers()
+        # Create loggers (shared with the visualizers above)
+        loggers = self._loggers
         
         # Create callbacks
         checkpoint_cb, earlystop_cb = self._create_callbacks()
+        best_step_cb = BestCheckpointStep(checkpoint_cb)
         
         # Create trainer
-        trainer = self._create_trainer(loggers, [checkpoint_cb, earlystop_cb])
+        trainer = self._create_trainer(loggers, [checkpoint_cb, earlystop_cb, best_step_cb])
+        
+        # Overlap batch uploads with compute (after the visualizers, which want CPU batches)
+        train_loader, val_loader = self._maybe_prefetch(train_loader, val_loader)
         
         # Train
         log.info(f"Training for {self.train_cfg.max_epochs} epochs...")
@@ -140,12 +223,10 @@ class TrainingStage:
             self.metrics["best_checkpoint"] = str(checkpoint_cb.best_model_path)
             self.metrics["best_val_loss"] = float(checkpoint_cb.best_model_score)
         
-        metrics_path = Path(self.paths.metrics_path)
-        with open(metrics_path, "w") as f:
-            json.dump(self.metrics, f, indent=2)
+        metrics_path = write_json(self.paths.metrics_path, self.metrics)
         
         # Export best model
-        self._export_best_model(checkpoint_cb)
+        self._export_best_model(checkpoint_cb, trainer, best_step_cb)
         
         # Summary
         log.info("=" * 80)
@@ -167,22 +248,22 @@ class TrainingStage:
         errors = []
         if not train_images.exists():
             errors.append(f"Train images directory not found: {train_images}")
-        elif not any(train_images.iterdir()):
+        elif not _nonempty(train_images):
             errors.append(f"Train images directory is empty: {train_images}")
         
         if not train_masks.exists():
             errors.append(f"Train masks directory not found: {train_masks}")
-        elif not any(train_masks.iterdir()):
+        elif not _nonempty(train_masks):
             errors.append(f"Train masks directory is empty: {train_masks}")
         
         if not val_images.exists():
             errors.append(f"Val images directory not found: {val_images}")
-        elif not any(val_images.iterdir()):
+        elif not _nonempty(val_images):
             errors.append(f"Val images directory is empty: {val_images}")
         
         if not val_masks.exists():
             errors.append(f"Val masks directory not found: {val_masks}")
-        elif not any(val_masks.iterdir()):
+        elif not _nonempty(val_masks):
             errors.append(f"Val masks directory is empty: {val_masks}")
         
         if errors:
@@ -192,8 +273,13 @@ class TrainingStage:
                 f"Please run 'agir-cvtoolkit preprocess' first or set auto_preprocess=true"
             )
     
-    def _setup_device(self) -> None:
-        """Setup GPU device."""
+    def _setup_device(self) -> Optional[List[int]]:
+        """
+        Setup GPU device.
+        
+        Returns:
+            GPU IDs selected for the Trainer when use_multi_gpu is set, else None
+        """
         if torch.cuda.is_available():
             # Enable TF32 for Ampere+ GPUs
             if torch.cuda.get_device_capability(0)[0] >= 8:
@@ -203,16 +289,107 @@ class TrainingStage:
             
             # Select GPUs if configured
             if self.train_cfg.get("use_multi_gpu", False):
-                gpu_cfg = self.train_cfg.get("gpu", {})
-                max_gpus = gpu_cfg.get("max_gpus", 1)
-                exclude_ids = gpu_cfg.get("exclude_ids", [])
+                max_gpus = self._sel("gpu.max_gpus", 1)
+                exclude_ids = self._sel("gpu.exclude_ids", [])
+                from agir_cvtoolkit.pipelines.utils.train_utils import select_available_gpus
+                
                 device_ids = select_available_gpus(max_gpus, exclude_ids, verbose=True)
                 log.info(f"Using GPUs: {device_ids}")
+                return device_ids
+        return None
+    
+    def _maybe_compile(self, model: LitSegmentation):
+        """
+        Wrap the Lightning module with torch.compile if enabled.
+        
+        Only applied on CUDA devices with compute capability >= 7.0 and a
+        torch that provides torch.compile. Lightning accepts the compiled
+        module in fit() and compiles the *_step methods through it.
+        Compilation is lazy: the first step pays the compile cost, and
+        compile errors surface there (inside fit), not here. With
+        compile.regional, only the encoder's repeated blocks are compiled
+        (see _compile_repeated_blocks).
+        """
+        if self._sel("thunder.enable", False):
+            return self._thunder_jit(model, self.train_cfg.thunder)
+        
+        if not self._sel("compile.enable", False):
+            return model
+        if not hasattr(torch, "compile"):
+            log.info("torch.compile unavailable, training in eager mode")
+            return model
+        if not torch.cuda.is_available() or torch.cuda.get_device_capability(0)[0] < 7:
+            log.info("torch.compile skipped (needs CUDA compute capability >= 7.0)")
+            return model
+        
+        mode = self._sel("compile.mode", "default")
+        if self._sel("compile.regional", False):
+            return self._compile_regional(model, mode)
+        compiled = torch.compile(
+            model,
+            mode=mode,
+            fullgraph=self._sel("compile.fullgraph", False),
+            dynamic=self._sel("compile.dynamic", False),
+        )
+        log.info(f"Compiled model with torch.compile(mode={mode!r})")
+        return compiled
+    
+    def _compile_regional(self, model: LitSegmentation, mode: str) -> LitSegmentation:
+        """
+        Compile the encoder's repeated blocks in place; decoder and head stay eager.
+        
+        Like torch.compile, nn.Module.compile is lazy: blocks compile on the
+        first forward, where any compile error surfaces.
+        """
+        encoder = getattr(model.model, "encoder", None)
+        if encoder is None or not hasattr(torch.nn.Module, "compile"):
+            log.info("Regional compile unavailable (no encoder or nn.Module.compile), training in eager mode")
+            return model
+        
+        n_blocks = _compile_repeated_blocks(
+            encoder,
+            mode=mode,
+            fullgraph=self._sel("compile.fullgraph", False),
+            dynamic=self._sel("compile.dynamic", False),
+        )
+        log.info(f"Marked {n_blocks} encoder blocks for torch.compile(mode={mode!r})")
+        return model
+    
+    def _thunder_jit(self, model: LitSegmentation, thunder_cfg) -> LitSegmentation:
+        """
+        Compile the inner network with Lightning Thunder instead of torch.compile.
+        
+        thunder.jit returns a ThunderModule, which Trainer.fit does not accept,
+        so only model.model is jitted and the LitSegmentation wrapper is kept.
+        Needs lightning-thunder plus the nvFuser and cuDNN frontend wheels
+        matching the installed torch/CUDA (e.g. nvfuser-cu121-torch24,
+        nvidia-cudnn-frontend). Falls back to eager if Thunder is missing,
+        jitting fails, or no CUDA device is available.
+        """
+        if not torch.cuda.is_available():
+            log.info("Thunder skipped (needs a CUDA device)")
+            return model
+        try:
+            import thunder
+        except ImportError:
+            log.warning("thunder.enable is set but lightning-thunder is not installed, training in eager mode")
+            return model
+        
+        executors = list(thunder_cfg.get("executors", ["cudnn", "nvfuser", "torch", "python"]))
+        try:
+            model.model = thunder.jit(model.model, executors=executors)
+        except Exception as e:
+            log.warning(f"thunder.jit failed ({e}), training in eager mode")
+            return model
+        log.info(f"Compiled network with thunder.jit(executors={executors})")
+        return model
     
     def _create_datasets(self):
         """Create train and validation datasets."""
         log.info("Creating datasets...")
         
+        from agir_cvtoolkit.pipelines.utils.train_utils import FieldDataset
+        
         train_ds = FieldDataset(self.cfg, mode="train")
         val_ds = FieldDataset(self.cfg, mode="val")
         
@@ -225,52 +402,99 @@ class TrainingStage:
         """Create train and validation dataloaders."""
         log.info("Creating dataloaders...")
         
+        from torch.utils.data import DataLoader
+        from agir_cvtoolkit.pipelines.utils.train_utils import get_batch_collate_fn, seed_worker
+        
         generator = torch.Generator()
         generator.manual_seed(self.train_cfg.seed)
         
-        train_collate_fn = get_batch_collate_fn(
-            self.cfg.augment.train.get("batch", {})
-        )
+        # With gpu_batch_augment, LitSegmentation mixes batches after transfer instead
+        if self.train_cfg.get("gpu_batch_augment", False) and torch.cuda.is_available():
+            train_collate_fn = get_batch_collate_fn({})
+        else:
+            train_collate_fn = get_batch_collate_fn(
+                self.cfg.augment.train.get("batch", {})
+            )
         val_collate_fn = get_batch_collate_fn(
             self.cfg.augment.val.get("batch", {})
         )
         
-        train_loader = DataLoader(
-            train_ds,
+        # Keep workers alive across epochs and prefetch a couple of batches each
+        num_workers = self.train_cfg.num_workers
+        loader_kwargs = dict(
             batch_size=self.train_cfg.batch_size,
-            shuffle=True,
-            num_workers=self.train_cfg.num_workers,
+            num_workers=num_workers,
             pin_memory=self.train_cfg.pin_memory,
             worker_init_fn=seed_worker,
             generator=generator,
+        )
+        if num_workers > 0:
+            loader_kwargs.update(
+                persistent_workers=self.train_cfg.get("persistent_workers", True),
+                prefetch_factor=self.train_cfg.get("prefetch_factor", 2),
+                multiprocessing_context=self.train_cfg.get("multiprocessing_context"),
+            )
+        
+        # Validation keeps every sample: val_loss picks the best checkpoint and
+        # drives early stopping. Under CUDA graphs (reduce-overhead) the short
+        # final val batch costs one re-record; val_drop_last opts out of that
+        val_drop_last = bool(self.train_cfg.get("val_drop_last", False))
+        
+        # drop_last keeps every train step at the same (cuDNN-autotuned/compiled) batch shape
+        train_loader = DataLoader(
+            train_ds,
+            shuffle=True,
+            drop_last=self.train_cfg.get("drop_last", True),
             collate_fn=train_collate_fn,
+            **loader_kwargs,
         )
         
         val_loader = DataLoader(
             val_ds,
-            batch_size=self.train_cfg.batch_size,
             shuffle=False,
-            num_workers=self.train_cfg.num_workers,
-            pin_memory=self.train_cfg.pin_memory,
-            worker_init_fn=seed_worker,
-            generator=generator,
+            drop_last=val_drop_last,
             collate_fn=val_collate_fn,
+            **loader_kwargs,
         )
         
         return train_loader, val_loader
     
+    def _maybe_prefetch(self, train_loader, val_loader):
+        """
+        Wrap the loaders in CUDAPrefetcher if enabled.
+        
+        Only used for single-GPU training: under multi-device strategies
+        Lightning must see plain DataLoaders to inject distributed samplers
+        and pick each rank's device.
+        """
+        if not self.train_cfg.get("gpu_prefetch", False):
+            return train_loader, val_loader
+        device_ids = self._device_ids or (
+            [torch.cuda.current_device()] if torch.cuda.is_available() and torch.cuda.device_count() == 1 else []
+        )
+        if not torch.cuda.is_available() or len(device_ids) != 1:
+            log.info("GPU prefetching skipped (needs exactly one CUDA training device)")
+            return train_loader, val_loader
+        if not self.train_cfg.pin_memory:
+            log.warning("gpu_prefetch without pin_memory: host-to-device copies will not be asynchronous")
+        
+        from agir_cvtoolkit.pipelines.utils.train_utils import CUDAPrefetcher
+        
+        device = torch.device("cuda", device_ids[0])
+        log.info(f"Prefetching batches to {device} on a side CUDA stream")
+        return CUDAPrefetcher(train_loader, device), CUDAPrefetcher(val_loader, device)
+    
     def _visualize_dataloader(self, train_loader):
         """Visualize dataloader batches."""
         log.info("Visualizing dataloader batches...")
         from agir_cvtoolkit.pipelines.utils.train_utils import vis_dataloader_batch
         
-        vis_cfg = self.train_cfg.dataloader_visualizer
-        loggers = self._create_loggers()
+        loggers = self._loggers
         vis_dataloader_batch(
             self.cfg,
             train_loader,
             loggers,
-            num_samples=vis_cfg.get("num_samples", 4)
+            num_samples=self._sel("dataloader_visualizer.num_samples", 4)
         )
     
     def _visualize_augmentations(self, train_loader):
@@ -278,88 +502,150 @@ class TrainingStage:
         log.info("Visualizing augmentations...")
         from agir_cvtoolkit.pipelines.utils.train_utils import vis_augmentation_batch
         
-        vis_cfg = self.train_cfg.augmentation_visualizer
-        loggers = self._create_loggers()
+        loggers = self._loggers
         vis_augmentation_batch(
             train_loader,
             loggers,
-            num_samples=vis_cfg.get("num_samples", 4)
+            num_samples=self._sel("augmentation_visualizer.num_samples", 4)
         )
     
+    @cached_property
+    def _loggers(self) -> List[Logger]:
+        """Loggers for the current run, instantiated once and shared by the trainer and visualizers."""
+        return self._create_loggers()
+    
     def _create_loggers(self) -> List[Logger]:
         """Create PyTorch Lightning loggers."""
         import hydra
         
         loggers = []
-        logger_cfg = self.train_cfg.get("logger", {})
         
         # CSV logger
-        if logger_cfg.get("csv", {}).get("enable", True):
-            csv_cfg = logger_cfg.csv
-            loggers.append(hydra.utils.instantiate(csv_cfg))
+        if self._sel("logger.csv.enable", True):
+            loggers.append(hydra.utils.instantiate(self.train_cfg.logger.csv))
         
         # WandB logger
-        if logger_cfg.get("wandb", {}).get("enable", False):
-            wandb_cfg = logger_cfg.wandb
-            loggers.append(hydra.utils.instantiate(wandb_cfg))
+        if self._sel("logger.wandb.enable", False):
+            loggers.append(hydra.utils.instantiate(self.train_cfg.logger.wandb))
         
         return loggers
     
     def _create_callbacks(self):
         """Create training callbacks."""
+        from pytorch_lightning.callbacks import ModelCheckpoint, EarlyStopping
+        
         # Checkpoint callback
         checkpoint_path = self.run_root / "checkpoints"
         checkpoint_path.mkdir(parents=True, exist_ok=True)
         
-        checkpoint_cfg = self.train_cfg.checkpoint
         checkpoint_cb = ModelCheckpoint(
             dirpath=str(checkpoint_path),
             filename="{epoch:02d}-{step}-{val_loss:.2f}",
-            monitor=checkpoint_cfg.get("monitor", "val_loss"),
-            mode=checkpoint_cfg.get("mode", "min"),
-            save_top_k=checkpoint_cfg.get("save_top_k", 3),
-            save_last=checkpoint_cfg.get("save_last", True),
+            monitor=self._sel("checkpoint.monitor", "val_loss"),
+            mode=self._sel("checkpoint.mode", "min"),
+            save_top_k=self._sel("checkpoint.save_top_k", 3),
+            save_last=self._sel("checkpoint.save_last", True),
         )
         
         # Early stopping callback
-        earlystop_cfg = self.train_cfg.early_stop
         earlystop_cb = EarlyStopping(
-            monitor=earlystop_cfg.get("monitor", "val_loss"),
-            mode=earlystop_cfg.get("mode", "min"),
-            patience=earlystop_cfg.get("patience", 10),
+            monitor=self._sel("early_stop.monitor", "val_loss"),
+            mode=self._sel("early_stop.mode", "min"),
+            patience=self._sel("early_stop.patience", 10),
         )
         
         return checkpoint_cb, earlystop_cb
     
     def _create_trainer(self, loggers, callbacks):
         """Create PyTorch Lightning trainer."""
-        trainer_cfg = self.train_cfg.trainer
+        from pytorch_lightning import Trainer
+        
+        precision = self._resolve_precision(self._sel("trainer.precision", "auto"))
+        log.info(f"Trainer precision: {precision}")
+        
+        # Train on the GPUs chosen in _setup_device; Lightning would otherwise take all visible ones
+        devices = self._device_ids or "auto"
+        strategy = self._sel("trainer.strategy", "auto")
+        if self._device_ids and len(self._device_ids) > 1 and strategy == "auto":
+            strategy = "ddp_find_unused_parameters_false"
+        
+        # Save checkpoints off the training loop
+        plugins = []
+        if self._sel("checkpoint.async_save", True):
+            from agir_cvtoolkit.pipelines.utils.train_utils import SnapshotAsyncCheckpointIO
+            plugins.append(SnapshotAsyncCheckpointIO())
         
         trainer = Trainer(
-            accelerator=trainer_cfg.get("accelerator", "auto"),
-            precision=trainer_cfg.get("precision", "32"),
+            accelerator=self._sel("trainer.accelerator", "auto"),
+            precision=precision,
             max_epochs=self.train_cfg.max_epochs,
-            deterministic=trainer_cfg.get("deterministic", False),
+            deterministic=self._sel("trainer.deterministic", False),
             logger=loggers,
             callbacks=callbacks,
             default_root_dir=str(self.run_root),
-            strategy=trainer_cfg.get("strategy", "auto"),
+            devices=devices,
+            strategy=strategy,
+            plugins=plugins,
         )
         
         return trainer
     
-    def _export_best_model(self, checkpoint_cb):
-        """Export best model weights as .pth file."""
+    @staticmethod
+    def _resolve_precision(precision) -> str:
+        """
+        Pick the Trainer precision.
+        
+        "auto", unset or "32" become "bf16-mixed" on Ampere+ GPUs (no loss
+        scaling needed) and "32-true" otherwise. Any other value, e.g.
+        "32-true" to force FP32, "16-mixed" or "transformer-engine" for FP8
+        on Hopper, is passed through unchanged.
+        """
+        precision = "auto" if precision is None else str(precision)
+        if precision not in ("auto", "32"):
+            return precision
+        if torch.cuda.is_available() and torch.cuda.get_device_capability(0)[0] >= 8:
+            return "bf16-mixed"
+        return "32-true"
+    
+    @staticmethod
+    def _best_is_in_memory(checkpoint_cb, trainer, best_step_cb) -> bool:
+        """Whether the trained module still holds the best checkpoint's weights (best written at the final step)."""
+        return (
+            best_step_cb.best_path == checkpoint_cb.best_model_path
+            and best_step_cb.best_step == trainer.global_step
+        )
+    
+    def _export_best_model(self, checkpoint_cb, trainer, best_step_cb):
+        """
+        Export best model weights as .pth file.
+        
+        When the best checkpoint was written at the final global step, the
+        weights are taken from the module in memory instead of reading the
+        checkpoint back.
+        """
+        from agir_cvtoolkit.pipelines.utils.train_utils import LitSegmentation
+        
         best_ckpt_path = checkpoint_cb.best_model_path
         if not best_ckpt_path:
             log.warning("No best checkpoint found, skipping export")
             return
         
-        log.info(f"Exporting best model from: {best_ckpt_path}")
-        
-        # Load checkpoint
-        ckpt = torch.load(best_ckpt_path, map_location="cpu", weights_only=False)
-        model_weights = ckpt["state_dict"]
+        module = trainer.lightning_module
+        if isinstance(module, LitSegmentation) and self._best_is_in_memory(checkpoint_cb, trainer, best_step_cb):
+            log.info(f"Exporting best model ({best_ckpt_path}) from the trained module")
+            model_weights = {k: v.detach().cpu() for k, v in module.state_dict().items()}
+        else:
+            log.info(f"Exporting best model from: {best_ckpt_path}")
+            
+            # Load checkpoint: memory-mapped with the safe tensor-only unpickler. Lightning
+            # checkpoints can also hold non-tensor objects (e.g. DictConfig hyperparameters),
+            # which weights_only rejects; fall back to the full unpickler for those
+            try:
+                ckpt = torch.load(best_ckpt_path, map_location="cpu", weights_only=True, mmap=True)
+            except Exception as e:
+                log.debug(f"weights_only load failed ({e}), retrying with full unpickling")
+                ckpt = torch.load(best_ckpt_path, map_location="cpu", weights_only=False, mmap=True)
+            model_weights = ckpt["state_dict"]
         
         # Export directory
         export_path = self.run_root / "model"
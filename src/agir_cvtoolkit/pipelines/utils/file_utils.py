@@ -0,0 +1,223 @@
+# src/agir_cvtoolkit/pipelines/utils/file_utils.py
+
+"""
+File utilities shared by pipeline stages.
+
+Includes:
+- Fast file copy using in-kernel copy syscalls
+- Placing files by copy, hardlink or symlink
+- JSON encoding/writing (orjson when installed, stdlib json otherwise)
+"""
+
+import errno
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+# orjson is optional; fall back to the stdlib encoder when it isn't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+log = logging.getLogger(__name__)
+
+# Errors meaning "this copy method is unsupported here", not a real I/O failure
+_UNSUPPORTED_ERRNOS = {
+    errno.ENOSYS,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.EBADF,
+}
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int) -> bool:
+    """
+    Copy with os.copy_file_range (reflinks on CoW filesystems).
+    
+    Returns False if unsupported or if it stopped short of size (some
+    filesystems report 0 bytes copied instead of an error).
+    """
+    if not hasattr(os, "copy_file_range"):
+        return False
+    copied = 0
+    try:
+        while copied < size:
+            n = os.copy_file_range(src_fd, dst_fd, size - copied)
+            if n == 0:
+                break
+            copied += n
+    except OSError as e:
+        if e.errno in _UNSUPPORTED_ERRNOS and copied == 0:
+            return False
+        raise
+    return copied == size
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int) -> bool:
+    """Copy with os.sendfile (no userspace buffer). Returns False if unsupported or short."""
+    if not hasattr(os, "sendfile"):
+        return False
+    copied = 0
+    try:
+        while copied < size:
+            n = os.sendfile(dst_fd, src_fd, copied, size - copied)
+            if n == 0:
+                break
+            copied += n
+    except OSError as e:
+        if e.errno in _UNSUPPORTED_ERRNOS and copied == 0:
+            return False
+        raise
+    return copied == size
+
+
+def _rewind(src_fd: int, dst_fd: int) -> None:
+    """Discard a partial copy so the next method starts from scratch."""
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    os.ftruncate(dst_fd, 0)
+    os.lseek(dst_fd, 0, os.SEEK_SET)
+
+
+def fast_copy(src: Path, dst: Path) -> Path:
+    """
+    Copy a file's data and metadata, like shutil.copy2.
+
+    Tries os.copy_file_range first (zero data movement on filesystems with
+    reflink support), then os.sendfile, then falls back to shutil.copyfile.
+    A method that is unsupported or copies fewer bytes than the source size
+    hands over to the next one.
+
+    Args:
+        src: Source file path
+        dst: Destination file path
+
+    Returns:
+        Destination path
+
+    Raises:
+        shutil.SameFileError: If src and dst refer to the same file
+    """
+    src, dst = Path(src), Path(dst)
+    # Opening dst for writing would truncate src if they are the same file
+    if dst.exists() and os.path.samefile(src, dst):
+        raise shutil.SameFileError(f"{src} and {dst} are the same file")
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(src_fd).st_size
+        copied = False
+        for method in (_copy_file_range, _sendfile):
+            if method(src_fd, dst_fd, size):
+                copied = True
+                break
+            _rewind(src_fd, dst_fd)
+
+    if not copied:
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+    return dst
+
+
+def place_file(src: Path, dst: Path, mode: str = "copy") -> Path:
+    """
+    Put src at dst by copying, hardlinking or symlinking it.
+    
+    If dst is already the requested kind of link to src (e.g. a resumed
+    run), nothing is done. Anything else at dst, including a link or a
+    dangling symlink left by an earlier run in another mode, is unlinked
+    first, so the copy never writes through it into another file.
+    Hardlinks fall back to fast_copy when linking is not possible
+    (different filesystem, no link support).
+    
+    Args:
+        src: Source file path
+        dst: Destination file path
+        mode: "copy", "hardlink" or "symlink"
+    
+    Returns:
+        Destination path
+    """
+    src, dst = Path(src), Path(dst)
+    if mode not in ("copy", "hardlink", "symlink"):
+        raise ValueError(f"Unknown file placement mode: {mode}")
+    
+    is_symlink = dst.is_symlink()
+    if is_symlink or dst.exists():
+        # Only a link of the requested kind counts as already placed
+        wanted_link = (mode == "symlink") if is_symlink else (mode == "hardlink")
+        if wanted_link and dst.exists() and os.path.samefile(src, dst):
+            return dst
+        dst.unlink()
+    
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return dst
+        except OSError as e:
+            log.debug(f"Hardlink failed for {src} ({e}), copying instead")
+    elif mode == "symlink":
+        os.symlink(src.resolve(), dst)
+        return dst
+    
+    return fast_copy(src, dst)
+
+
+# ============================================================================
+# JSON
+# ============================================================================
+
+def _json_default(obj):
+    """Encode numpy arrays/scalars for the stdlib fallback (orjson handles them natively)."""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_json_bytes(obj, indent: bool = False) -> bytes:
+    """
+    Encode an object as UTF-8 JSON bytes.
+    
+    Args:
+        obj: Object to encode
+        indent: If True, pretty-print with 2-space indentation
+    
+    Returns:
+        Encoded JSON
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if indent else None, default=_json_default).encode("utf-8")
+
+
+def write_json(path: Path, obj, atomic: bool = False) -> Path:
+    """
+    Write an object to a pretty-printed JSON file.
+    
+    Args:
+        path: Output file path
+        obj: Object to encode
+        atomic: If True, write to a temp file and os.replace it into place,
+            so readers (or a crash) never see a partially written file
+    
+    Returns:
+        Output path
+    """
+    path = Path(path)
+    data = dumps_json_bytes(obj, indent=True)
+    if not atomic:
+        path.write_bytes(data)
+        return path
+    
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return path
@@ -1,40 +1,83 @@
 # src/agir_cvtoolkit/pipeline/hydra_utils.py
 from __future__ import annotations
 from pathlib import Path
-from omegaconf import DictConfig, OmegaConf, MISSING
+from omegaconf import DictConfig, ListConfig, OmegaConf, MISSING
 from datetime import datetime
-import hashlib, json, socket, getpass, subprocess
+from enum import Enum
+import functools, hashlib, json, os, socket, getpass, subprocess
 import yaml
 
+# libyaml-backed loader/dumper when PyYAML was built with it; pure-Python otherwise
+try:
+    from yaml import CSafeLoader as _YamlLoader, CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader, SafeDumper as _YamlDumper
+
 
 VOLATILE_KEYS = {"working_dir", "runtime", "paths"}  # don't hash these    
 
 def read_yaml(path: Path) -> dict:
-    with open(path, "r") as f:
-        return yaml.safe_load(f)
+    # Bytes in: the loader detects and decodes the encoding itself
+    with open(path, "rb") as f:
+        return yaml.load(f, Loader=_YamlLoader)
     
 def _to_resolved_dict(cfg: DictConfig) -> dict:
     """Resolve all interpolations and convert to plain dict."""
     return OmegaConf.to_container(cfg, resolve=True, enum_to_str=True)  # type: ignore
 
-def _material_cfg_dict(resolved: dict) -> dict:
-    """Strip volatile/runtime keys before hashing to get a stable 'behavior' hash."""
-    def _strip(d: dict) -> dict:
-        out = {}
-        for k, v in d.items():
-            if k in VOLATILE_KEYS:
-                continue
-            if isinstance(v, dict):
-                out[k] = _strip(v)
-            else:
-                out[k] = v
-        return out
-    return _strip(resolved)
+def _resolve_material(cfg: DictConfig) -> dict:
+    """
+    Resolve cfg to a plain dict, skipping volatile/runtime keys at every level.
 
-def _config_hash(material: dict, n: int = 8) -> str:
-    s = json.dumps(material, sort_keys=True, separators=(",", ":"))
-    return hashlib.md5(s.encode()).hexdigest()[:n]
+    One walk over the DictConfig: volatile branches are never resolved or
+    converted, instead of converting everything and stripping them afterwards.
+    """
+    out = {}
+    for k in cfg.keys():
+        if k in VOLATILE_KEYS:
+            continue
+        if OmegaConf.is_missing(cfg, k):
+            out[k] = "???"
+            continue
+        v = cfg[k]
+        if isinstance(v, DictConfig):
+            out[k] = _resolve_material(v)
+        elif OmegaConf.is_config(v):
+            out[k] = OmegaConf.to_container(v, resolve=True, enum_to_str=True)
+        elif isinstance(v, Enum):
+            out[k] = v.name
+        else:
+            out[k] = v
+    return out
+
+def _canonical_stream(obj, h) -> None:
+    """Feed a canonical encoding of obj (dict keys sorted, JSON scalars) into hasher h, piece by piece."""
+    if isinstance(obj, dict):
+        h.update(b"{")
+        for k in sorted(obj, key=str):
+            h.update(json.dumps(str(k)).encode())
+            h.update(b":")
+            _canonical_stream(obj[k], h)
+            h.update(b",")
+        h.update(b"}")
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"[")
+        for v in obj:
+            _canonical_stream(v, h)
+            h.update(b",")
+        h.update(b"]")
+    else:
+        h.update(json.dumps(obj, default=str).encode())
 
+def _config_hash(material: dict, n: int = 8) -> str:
+    # Only a run-id discriminator, so a fast non-cryptographic-use hash over a
+    # streamed encoding; no intermediate JSON string of the whole config
+    h = hashlib.blake2b(digest_size=16)
+    _canonical_stream(material, h)
+    return h.hexdigest()[:n]
+
+# Stable for the life of the process; git rev-parse forks a subprocess each call
+@functools.cache
 def _git_commit() -> str | None:
     try:
         out = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL)
@@ -42,6 +85,14 @@ def _git_commit() -> str | None:
     except Exception:
         return None
     
+@functools.cache
+def _cached_user() -> str:
+    return getpass.getuser()
+
+@functools.cache
+def _cached_host() -> str:
+    return socket.gethostname()
+
 def _make_run_id(proj_dir: str, sub_proj_dir: str, dataset: str, cfg_hash: str, seed: int | None) -> str:
 
     if proj_dir and sub_proj_dir:
@@ -53,9 +104,25 @@ def _make_run_id(proj_dir: str, sub_proj_dir: str, dataset: str, cfg_hash: str,
         tail = f"seed{seed}" if seed is not None else f"h={cfg_hash}"
         return f"{tail}"
 
+def _has_nulls(cfg: DictConfig | ListConfig) -> bool:
+    """Whether cfg holds any None/MISSING value; stops at the first one and never resolves interpolations."""
+    keys = cfg.keys() if isinstance(cfg, DictConfig) else range(len(cfg))
+    for k in keys:
+        if OmegaConf.is_missing(cfg, k):
+            return True
+        if OmegaConf.is_interpolation(cfg, k):
+            continue
+        v = cfg[k]
+        if v is None or (OmegaConf.is_config(v) and _has_nulls(v)):
+            return True
+    return False
+
 def _prune_nulls(obj):
     """Recursively drop keys whose value is None or MISSING so they don't overwrite prior values."""
     if isinstance(obj, DictConfig):
+        # Common case: nothing to prune, so merge the DictConfig as-is
+        if not _has_nulls(obj):
+            return obj
         obj = OmegaConf.to_container(obj, resolve=False)
     if isinstance(obj, dict):
         return {k: _prune_nulls(v)
@@ -94,15 +161,20 @@ def finalize_cfg(cfg: DictConfig, *, stage: str, dataset: str, cli_overrides: li
     out_root = Path(str(cfg.get("io", {}).get("out_root", "./outputs"))).expanduser()
     out_root.mkdir(parents=True, exist_ok=True)
 
-    resolved = _to_resolved_dict(cfg)
-    material = _material_cfg_dict(resolved)
-    cfg_hash = _config_hash(material)
+    # Re-finalizing an already finalized cfg with the same overrides: runtime.hash
+    # is the memoized hash, so skip resolving, stripping and dumping the whole tree
+    prev_hash = OmegaConf.select(cfg, "runtime.hash", default=None)
+    prev_overrides = OmegaConf.select(cfg, "runtime.cli_overrides", default=None)
+    if prev_hash is not None and list(prev_overrides or []) == list(cli_overrides or []):
+        cfg_hash = prev_hash
+    else:
+        cfg_hash = _config_hash(_resolve_material(cfg))
 
     # Seed: look in common places; adjust as needed
-    seed = resolved.get("seed", None)
+    seed = OmegaConf.select(cfg, "seed", default=None)
 
-    project_name = resolved.get("project", {}).get("name", None)
-    sub_project_name = resolved.get("project", {}).get("subname", None)
+    project_name = OmegaConf.select(cfg, "project.name", default=None)
+    sub_project_name = OmegaConf.select(cfg, "project.subname", default=None)
     run_id = _make_run_id(proj_dir=project_name, sub_proj_dir=sub_project_name,
                           dataset=dataset, cfg_hash=cfg_hash, seed=seed)
     run_root = out_root / run_id
@@ -119,8 +191,13 @@ def finalize_cfg(cfg: DictConfig, *, stage: str, dataset: str, cli_overrides: li
         "cvat_downloads": run_root / "cvat_downloads",  # ADD THIS LINE
         "preprocessed": run_root / "preprocessed",
     }
-    for p in [run_root, *sub.values()]:
-        p.mkdir(parents=True, exist_ok=True)
+    # Only run_root needs the parents walk; each subdir is then a single mkdir(2)
+    run_root.mkdir(parents=True, exist_ok=True)
+    for p in sub.values():
+        try:
+            os.mkdir(p)
+        except FileExistsError:
+            pass
 
     # ---- Load previous cfg (if any) and merge, ignoring nulls from current stage
     # cfg_path = run_root / "cfg.yaml"
@@ -133,8 +210,8 @@ def finalize_cfg(cfg: DictConfig, *, stage: str, dataset: str, cli_overrides: li
         "stage": stage,
         "dataset": dataset,
         "created_local": datetime.now().isoformat(timespec="seconds"),
-        "user": getpass.getuser(),
-        "host": socket.gethostname(),
+        "user": _cached_user(),
+        "host": _cached_host(),
         "git_commit": _git_commit(),
         "cli_overrides": cli_overrides or [],
         "hash": cfg_hash,
@@ -162,10 +239,13 @@ def finalize_cfg(cfg: DictConfig, *, stage: str, dataset: str, cli_overrides: li
     cfg.train.logger.wandb.save_dir = cfg.paths.logs
     cfg.train.logger.wandb.name = cfg.runtime.run_id
 
-    # Persist the frozen cfg for reproducibility (after we enriched it)
+    # Persist the frozen cfg for reproducibility (after we enriched it) with the
+    # libyaml dumper. This is a second resolve of the tree: the hashing pass skips
+    # volatile keys, the logger dirs were set after it, and values interpolating
+    # runtime/paths must see the new ones, so its dict cannot be reused here
     cfg_path = Path(cfg.paths["cfg_path"])
     with open(cfg_path, "w") as f:
-        OmegaConf.save(config=cfg, f=f.name, resolve=True)
+        yaml.dump(_to_resolved_dict(cfg), f, Dumper=_YamlDumper, sort_keys=False, allow_unicode=True)
 
     # Touch metrics + manifest files
     Path(cfg.paths["metrics_path"]).write_text("{}")
@@ -19,6 +19,11 @@ from PIL import Image
 
 log = logging.getLogger(__name__)
 
+# Cutout ID patterns for extract_cutout_id, compiled once (called per mask)
+_RE_TASK_CUTOUT_ID = re.compile(r'[a-z_]+_([A-Z0-9_]+)$')
+_RE_PURE_CUTOUT_ID = re.compile(r'^[A-Z0-9_]+$')
+_RE_ANY_CUTOUT_ID = re.compile(r'([A-Z0-9_]{10,})')
+
 
 class ImageResolver:
     """Resolves image locations for masks and creates training manifests."""
@@ -75,17 +80,17 @@ class ImageResolver:
         
         # Pattern 1: task_name_cutout_id (from aggregated tasks)
         # Look for pattern like "barley_task_IMG_20240101_123456"
-        match = re.search(r'[a-z_]+_([A-Z0-9_]+)$', stem)
+        match = _RE_TASK_CUTOUT_ID.search(stem)
         if match:
             return match.group(1)
         
         # Pattern 2: Just the cutout_id
         # Format: IMG_YYYYMMDD_HHMMSS or similar
-        if re.match(r'^[A-Z0-9_]+$', stem):
+        if _RE_PURE_CUTOUT_ID.match(stem):
             return stem
         
         # Pattern 3: Extract any uppercase alphanumeric segment
-        match = re.search(r'([A-Z0-9_]{10,})', stem)
+        match = _RE_ANY_CUTOUT_ID.search(stem)
         if match:
             return match.group(1)
         
@@ -11,11 +11,12 @@ Includes:
 
 import json
 import logging
+import os
 import random
 import shutil
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 from PIL import Image
@@ -189,6 +190,7 @@ def pad_gridcrop_resize_preprocess(
     out_images: Path,
     out_masks: Path,
     cfg: dict,
+    sink: Optional[Callable[[str], Tuple[Path, Path]]] = None,
 ) -> None:
     """
     Standardize all images to fixed size using pad/grid-crop/resize.
@@ -199,14 +201,26 @@ def pad_gridcrop_resize_preprocess(
         out_images: Output images directory
         out_masks: Output masks directory
         cfg: Preprocessing config
+        sink: Optional callable mapping a source image stem to its
+            (images_dir, masks_dir) destination. When given, outputs are
+            written there instead of out_images/out_masks, e.g. straight
+            into train/val/test directories.
     """
     log.info("Starting pad/grid-crop/resize preprocessing...")
     
-    out_images.mkdir(parents=True, exist_ok=True)
-    out_masks.mkdir(parents=True, exist_ok=True)
+    if sink is None:
+        out_images.mkdir(parents=True, exist_ok=True)
+        out_masks.mkdir(parents=True, exist_ok=True)
+        sink = lambda _stem: (out_images, out_masks)
     
     # Find all image files
-    img_paths = sorted(images_dir.glob("*.jpg")) + sorted(images_dir.glob("*.JPG"))
+    # One directory pass with a case-insensitive suffix check (two globs would
+    # double-count on case-insensitive filesystems)
+    with os.scandir(images_dir) as it:
+        img_paths = sorted(
+            Path(e.path) for e in it
+            if e.name.lower().endswith((".jpg", ".jpeg")) and e.is_file()
+        )
     
     use_cc = bool(cfg.get('use_concurrency', False))
     workers = int(cfg.get('num_workers', 1)) if use_cc else 1
@@ -226,7 +240,7 @@ def pad_gridcrop_resize_preprocess(
                     log.warning(f"No mask found for {img_path.name}, skipping")
                     continue
                 
-                fut = exe.submit(_process_one_image, img_path, mask_path, out_images, out_masks, cfg)
+                fut = exe.submit(_process_one_image, img_path, mask_path, *sink(img_path.stem), cfg)
                 futures[fut] = img_path
             
             for fut in as_completed(futures):
@@ -244,7 +258,7 @@ def pad_gridcrop_resize_preprocess(
                 continue
             
             try:
-                _process_one_image(img_path, mask_path, out_images, out_masks, cfg)
+                _process_one_image(img_path, mask_path, *sink(img_path.stem), cfg)
             except Exception as e:
                 log.error(f"Failed to process {img_path.name}: {e}")
     
@@ -255,6 +269,36 @@ def pad_gridcrop_resize_preprocess(
 # TRAIN/VAL/TEST SPLIT
 # ============================================================================
 
+def assign_splits(names: List[str], cfg: dict, seed: int) -> Dict[str, str]:
+    """
+    Deterministically assign each name to 'train', 'val' or 'test'.
+    
+    Uses the same shuffle-and-slice rule as train_val_test_split, so the
+    assignment can be computed before any outputs exist.
+    
+    Args:
+        names: Keys to assign (e.g. source image stems)
+        cfg: Split config with 'train'/'val'/'test' ratios
+        seed: Random seed for reproducibility
+    
+    Returns:
+        Dict mapping each name to its split
+    """
+    set_seed(seed)
+    
+    ordered = sorted(names)
+    random.shuffle(ordered)
+    
+    total = len(ordered)
+    n_train = int(cfg['train'] * total)
+    n_val = int(cfg['val'] * total)
+    
+    assignment = {n: 'train' for n in ordered[:n_train]}
+    assignment.update((n, 'val') for n in ordered[n_train:n_train + n_val])
+    assignment.update((n, 'test') for n in ordered[n_train + n_val:])
+    return assignment
+
+
 def _copy_one_file(
     img_path: Path,
     mask_path: Path,
@@ -374,29 +418,32 @@ def train_val_test_split(
 # DATASET STATISTICS
 # ============================================================================
 
-def _stats_for_one_image(img_path: Path) -> Tuple[np.ndarray, np.ndarray, int]:
+def _stats_for_one_image(img_path: Path) -> np.ndarray:
     """
-    Compute per-image channel statistics.
+    Compute per-image channel histograms.
+    
+    Works directly on the uint8 pixels (no float promotion), so the
+    per-image cost is a bincount per channel.
     
     Args:
         img_path: Path to RGB image
     
     Returns:
-        sum_c: Sum of pixel values per channel (3,)
-        sum_sq: Sum of squared pixel values per channel (3,)
-        pixels: Total number of pixels
+        Per-channel pixel value counts (3, 256), int64
     """
-    img = Image.open(img_path).convert("RGB")
-    arr = np.asarray(img, dtype=np.float64) / 255.0  # Normalize to [0, 1]
-    
-    h, w, _ = arr.shape
-    pixels = h * w
-    
-    flat = arr.reshape(pixels, 3)
-    sum_c = flat.sum(axis=0)
-    sum_sq = (flat ** 2).sum(axis=0)
-    
-    return sum_c, sum_sq, pixels
+    arr = np.asarray(Image.open(img_path).convert("RGB"))
+    hist = np.empty((3, 256), dtype=np.int64)
+    for c in range(3):
+        hist[c] = np.bincount(arr[:, :, c].ravel(), minlength=256)
+    return hist
+
+
+def _safe_stats_for_one_image(img_path: Path):
+    """Worker wrapper: return (img_path, histogram or None, error message or None)."""
+    try:
+        return img_path, _stats_for_one_image(img_path), None
+    except Exception as e:
+        return img_path, None, str(e)
 
 
 def compute_rgb_mean_std(
@@ -407,6 +454,9 @@ def compute_rgb_mean_std(
     """
     Compute dataset-wide RGB mean and standard deviation.
     
+    Per-image uint8 histograms are computed in worker processes and summed;
+    mean and variance then follow exactly from the combined histogram.
+    
     Args:
         images_dir: Directory containing training images
         out_file: Output JSON file path
@@ -421,40 +471,34 @@ def compute_rgb_mean_std(
     log.info(f"Processing {len(img_paths)} images for statistics...")
     
     use_cc = bool(cfg.get('use_concurrency', False))
-    workers = int(cfg.get('num_workers', 1)) if use_cc else 1
+    workers = int(cfg.get('num_workers') or os.cpu_count() or 1) if use_cc else 1
     
-    sum_c = np.zeros(3, dtype=np.float64)
-    sum_sq = np.zeros(3, dtype=np.float64)
-    total_pixels = 0
+    hist = np.zeros((3, 256), dtype=np.int64)
     
     if use_cc and workers > 1:
-        # Parallel processing
+        # Parallel processing; chunking keeps IPC overhead low for many small images
         with ProcessPoolExecutor(max_workers=workers) as exe:
-            futures = {exe.submit(_stats_for_one_image, p): p for p in img_paths}
-            for fut in as_completed(futures):
-                img_path = futures[fut]
-                try:
-                    sc, ssq, pix = fut.result()
-                    sum_c += sc
-                    sum_sq += ssq
-                    total_pixels += pix
-                except Exception as e:
-                    log.error(f"Failed to compute stats for {img_path.name}: {e}")
+            results = exe.map(_safe_stats_for_one_image, img_paths, chunksize=16)
+            for img_path, img_hist, err in results:
+                if err is not None:
+                    log.error(f"Failed to compute stats for {img_path.name}: {err}")
+                    continue
+                hist += img_hist
     else:
         # Sequential processing
         for img_path in img_paths:
             try:
-                sc, ssq, pix = _stats_for_one_image(img_path)
-                sum_c += sc
-                sum_sq += ssq
-                total_pixels += pix
+                hist += _stats_for_one_image(img_path)
             except Exception as e:
                 log.error(f"Failed to compute stats for {img_path.name}: {e}")
     
-    # Compute mean and std
-    mean = (sum_c / total_pixels).tolist()
-    var = (sum_sq / total_pixels) - np.square(mean)
-    std = np.sqrt(var).tolist()
+    # Compute mean and std (population variance) from the histogram
+    values = np.arange(256, dtype=np.float64) / 255.0  # Normalize to [0, 1]
+    total_pixels = hist[0].sum()
+    mean_c = (hist * values).sum(axis=1) / total_pixels
+    var_c = (hist * np.square(values[None, :] - mean_c[:, None])).sum(axis=1) / total_pixels
+    mean = mean_c.tolist()
+    std = np.sqrt(var_c).tolist()
     
     stats = {"mean": mean, "std": std}
     
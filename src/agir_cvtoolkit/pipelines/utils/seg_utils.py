@@ -6,19 +6,37 @@ Modular components for model loading, tiled inference, post-processing, and visu
 from __future__ import annotations
 
 import ast
+import logging
+import os
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import cv2
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import numpy as np
 import torch
+import torch.nn.functional as F
 from PIL import Image
 from omegaconf import DictConfig
 
 import GPUtil    
 import segmentation_models_pytorch as smp
 
+# PyTurboJPEG is optional; when usable, RGB JPEGs are encoded without a BGR copy
+try:
+    from turbojpeg import TJPF_RGB, TJSAMP_420, TJSAMP_422, TJSAMP_444, TurboJPEG
+    _turbojpeg = TurboJPEG()
+except Exception:  # not installed, or libturbojpeg not found
+    _turbojpeg = None
+
+# onnxruntime is optional; only needed for the "onnx"/"trt" inference engines
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+log = logging.getLogger(__name__)
+
 
 # ======================= GPU Utilities =======================
 
@@ -49,6 +67,53 @@ def select_available_gpus(
 
 # ======================= Model Components =======================
 
+# Autocast dtypes by precision name (None = plain FP32)
+_AUTOCAST_DTYPES = {
+    "fp32": None,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+}
+
+
+class OrtSegModule:
+    """
+    Callable stand-in for the torch model, backed by an ONNX Runtime session.
+    
+    Takes and returns torch tensors; inputs and outputs are bound directly to
+    the tensors' device memory (IO binding), so there is no host round-trip.
+    """
+    
+    def __init__(self, session, num_classes: int):
+        self.session = session
+        self.num_classes = num_classes
+        self.input_name = session.get_inputs()[0].name
+        self.output_name = session.get_outputs()[0].name
+    
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        x = x.float().contiguous()  # exported graph is FP32 NCHW
+        out = torch.empty(
+            (x.shape[0], self.num_classes, *x.shape[2:]), dtype=torch.float32, device=x.device
+        )
+        device_type = "cuda" if x.is_cuda else "cpu"
+        device_id = x.device.index or 0
+        
+        if x.is_cuda:
+            # ORT runs on its own stream; make sure the (async) input copy has landed
+            torch.cuda.current_stream(x.device).synchronize()
+        
+        binding = self.session.io_binding()
+        binding.bind_input(
+            name=self.input_name, device_type=device_type, device_id=device_id,
+            element_type=np.float32, shape=tuple(x.shape), buffer_ptr=x.data_ptr(),
+        )
+        binding.bind_output(
+            name=self.output_name, device_type=device_type, device_id=device_id,
+            element_type=np.float32, shape=tuple(out.shape), buffer_ptr=out.data_ptr(),
+        )
+        self.session.run_with_iobinding(binding)
+        return out
+
+
 class SegModel:
     """
     Wrapper for segmentation models with preprocessing.
@@ -65,6 +130,7 @@ class SegModel:
         encoder_weights: Optional[str] = "imagenet",
         mean: Optional[List[float]] = None,
         std: Optional[List[float]] = None,
+        precision: str = "fp32",
     ):
         
         self.arch = arch.lower()
@@ -73,10 +139,22 @@ class SegModel:
         self.num_classes = num_classes
         self.encoder_weights = encoder_weights
         
+        # Autocast precision for CUDA inference: "fp32" | "fp16" | "bf16"
+        if precision not in _AUTOCAST_DTYPES:
+            raise ValueError(f"Unsupported precision: {precision}")
+        self.precision = precision
+        self.channels_last = False  # set by use_channels_last()
+        
         # Normalization params
         self.mean = np.array(mean or [0.485, 0.456, 0.406], dtype=np.float32)
         self.std = np.array(std or [0.229, 0.224, 0.225], dtype=np.float32)
         
+        # Reused uint8 host staging buffers (pinned on CUDA) keyed by NHWC shape,
+        # the events marking their last async H2D copy, and per-device mean/std
+        self._host_bufs: Dict[Tuple[int, ...], torch.Tensor] = {}
+        self._h2d_events: Dict[Tuple[int, ...], Optional[torch.cuda.Event]] = {}
+        self._norm_t: Dict[torch.device, Tuple[torch.Tensor, torch.Tensor]] = {}
+        
         # Build model
         self.model = self._build_model()
         self.model.eval()
@@ -126,6 +204,201 @@ class SegModel:
         self.model.to(device)
         self.model.eval()
     
+    def autocast_dtype(self, device: torch.device) -> Optional[torch.dtype]:
+        """
+        Resolve the autocast dtype for this device, or None to run in FP32.
+        
+        Autocast is CUDA-only here; bf16 falls back to fp16 on GPUs without
+        bf16 support.
+        """
+        dtype = _AUTOCAST_DTYPES[self.precision]
+        if dtype is None or device.type != "cuda":
+            return None
+        if dtype is torch.bfloat16 and not torch.cuda.is_bf16_supported():
+            return torch.float16
+        return dtype
+    
+    def _host_buffer(self, shape: Tuple[int, ...], device: torch.device) -> torch.Tensor:
+        """
+        Reusable uint8 host staging buffer for an NHWC input shape.
+        
+        Pinned on CUDA so the H2D copy can be asynchronous. Before handing out
+        a buffer again, wait for its previous copy to the device to finish.
+        """
+        buf = self._host_bufs.get(shape)
+        if buf is None:
+            is_cuda = device.type == "cuda"
+            buf = torch.zeros(shape, dtype=torch.uint8, pin_memory=is_cuda)
+            self._host_bufs[shape] = buf
+            self._h2d_events[shape] = torch.cuda.Event() if is_cuda else None
+        elif self._h2d_events[shape] is not None:
+            self._h2d_events[shape].synchronize()
+        return buf
+    
+    def _norm_tensors(self, device: torch.device) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Mean/std as (1, C, 1, 1) tensors on device (cached)."""
+        if device not in self._norm_t:
+            self._norm_t[device] = (
+                torch.from_numpy(self.mean).view(1, -1, 1, 1).to(device),
+                torch.from_numpy(self.std).view(1, -1, 1, 1).to(device),
+            )
+        return self._norm_t[device]
+    
+    def use_channels_last(self, device: torch.device) -> bool:
+        """
+        Switch the model and its inputs to channels-last (NHWC) memory format.
+        
+        Only applied on CUDA with FP16/BF16 autocast, where cuDNN's tensor-core
+        conv kernels run natively in NHWC; in FP32 the gain is negligible.
+        Call after load_checkpoint and before compile.
+        
+        Returns:
+            True if channels-last was enabled
+        """
+        if self.autocast_dtype(device) is None:
+            log.info("channels_last skipped (needs CUDA with fp16/bf16 precision)")
+            return False
+        self.model = self.model.to(memory_format=torch.channels_last)
+        self.channels_last = True
+        log.info("Using channels_last memory format")
+        return True
+    
+    def use_onnxruntime(
+        self,
+        onnx_path: Path,
+        input_hw: Tuple[int, int],
+        device: torch.device,
+        tensorrt: bool = False,
+    ) -> bool:
+        """
+        Export the model to ONNX and run it with ONNX Runtime from now on.
+        
+        The graph is exported with a static HxW (tiles are fixed-size) and a
+        dynamic batch axis. An existing file at onnx_path is reused as-is, so
+        callers can cache exports across runs by keying the path. On CUDA the CUDA execution provider is used, with
+        TensorRT in front of it when tensorrt=True (fp16 enabled unless
+        precision is fp32). Falls back to the torch model if onnxruntime is
+        not installed or the export fails.
+        
+        Args:
+            onnx_path: Where to write the exported graph
+            input_hw: Padded tile (height, width)
+            device: torch device
+            tensorrt: Use ONNX Runtime's TensorRT execution provider
+        
+        Returns:
+            True if ONNX Runtime is now used for the forward pass
+        """
+        if ort is None:
+            log.warning("onnxruntime is not installed, using torch model")
+            return False
+        
+        providers = ["CPUExecutionProvider"]
+        if device.type == "cuda":
+            providers.insert(0, ("CUDAExecutionProvider", {"device_id": device.index or 0}))
+            if tensorrt:
+                providers.insert(0, ("TensorrtExecutionProvider", {
+                    "device_id": device.index or 0,
+                    "trt_fp16_enable": self.precision != "fp32",
+                    "trt_engine_cache_enable": True,
+                    "trt_engine_cache_path": str(Path(onnx_path).parent),
+                }))
+        
+        onnx_path = Path(onnx_path)
+        try:
+            if onnx_path.exists():
+                log.info(f"Reusing exported ONNX model: {onnx_path}")
+            else:
+                # Export to a temp file first so an interrupted export is never reused
+                tmp_path = onnx_path.with_name(onnx_path.name + ".tmp")
+                dummy = torch.zeros((1, self.in_channels, *input_hw), device=device)
+                with torch.inference_mode():
+                    torch.onnx.export(
+                        self.model, dummy, str(tmp_path),
+                        input_names=["input"], output_names=["logits"],
+                        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+                        opset_version=17,
+                    )
+                os.replace(tmp_path, onnx_path)
+                log.info(f"Exported ONNX model: {onnx_path}")
+            session = ort.InferenceSession(str(onnx_path), providers=providers)
+        except Exception as e:
+            log.warning(f"ONNX Runtime setup failed ({e}), using torch model")
+            return False
+        
+        self.model = OrtSegModule(session, self.num_classes)
+        log.info(f"Running inference with ONNX Runtime ({session.get_providers()[0]})")
+        return True
+    
+    def compile(self, device: torch.device, mode: str = "reduce-overhead", fullgraph: bool = False) -> bool:
+        """
+        Compile the forward pass with torch.compile.
+        
+        Only applied on CUDA devices with compute capability >= 7.0 and a
+        torch that provides torch.compile. Shapes are kept static (tiles are
+        fixed-size), so each batch shape compiles once. Compilation is lazy;
+        call warmup() to trigger it and fall back to eager if it fails.
+        
+        Args:
+            device: Device the model runs on
+            mode: torch.compile mode ("reduce-overhead" captures CUDA graphs)
+            fullgraph: Require a single graph (no Python fallbacks); a graph
+                break then fails at warmup and reverts to eager
+        
+        Returns:
+            True if the model was wrapped
+        """
+        if not hasattr(torch, "compile"):
+            log.info("torch.compile unavailable, using eager model")
+            return False
+        if device.type != "cuda" or torch.cuda.get_device_capability(device)[0] < 7:
+            log.info("torch.compile skipped (needs CUDA compute capability >= 7.0)")
+            return False
+        
+        try:
+            self._eager_model = self.model
+            self.model = torch.compile(self.model, mode=mode, fullgraph=fullgraph, dynamic=False)
+        except Exception as e:
+            log.warning(f"torch.compile failed ({e}), using eager model")
+            self.model = self._eager_model
+            return False
+        log.info(f"Compiled model with torch.compile(mode={mode!r}, fullgraph={fullgraph})")
+        return True
+    
+    @property
+    def uses_onnxruntime(self) -> bool:
+        """Whether the forward pass runs through ONNX Runtime (fixed tile HxW, see use_onnxruntime)."""
+        return isinstance(self.model, OrtSegModule)
+    
+    @property
+    def is_compiled(self) -> bool:
+        """Whether the forward pass is currently the torch.compile'd model."""
+        eager = getattr(self, "_eager_model", None)
+        return eager is not None and self.model is not eager
+    
+    def warmup(
+        self,
+        tile_hw: Tuple[int, int],
+        batch_size: int,
+        device: torch.device,
+        pad_divisor: int = 32,
+    ) -> None:
+        """
+        Run one dummy batch so compilation/autotuning happens before timing starts.
+        
+        If the compiled model fails here, revert to the eager model.
+        """
+        dummy = [np.zeros((*tile_hw, 3), dtype=np.uint8)] * batch_size
+        try:
+            self.predict_batch(dummy, device, pad_divisor)
+        except Exception as e:
+            eager = getattr(self, "_eager_model", None)
+            if eager is None or eager is self.model:
+                raise
+            log.warning(f"Compiled model failed on warm-up ({e}), falling back to eager")
+            self.model = eager
+            self.predict_batch(dummy, device, pad_divisor)
+    
     def preprocess(self, img_rgb_u8: np.ndarray) -> np.ndarray:
         """
         Convert RGB uint8 -> normalized float32 for model input.
@@ -136,7 +409,6 @@ class SegModel:
         x = (x - self.mean) / self.std
         return x
     
-    @torch.no_grad()
     def predict(
         self,
         img_rgb_u8: np.ndarray,
@@ -152,36 +424,108 @@ class SegModel:
             pad_divisor: pad to multiple of this (for encoder stride)
         
         Returns:
-            - Binary: HxW uint8 mask (0 or 255)
-            - Multi-class: HxW int32 class indices
+            - Binary: HxW float32 probabilities
+            - Multi-class: HxWxC float32 class probabilities
+        """
+        return self.predict_batch([img_rgb_u8], device, pad_divisor)[0]
+    
+    def predict_batch(
+        self,
+        imgs_rgb_u8: List[np.ndarray],
+        device: torch.device,
+        pad_divisor: int = 32,
+    ) -> List[np.ndarray]:
+        """
+        Run inference on a batch of same-sized images in one forward pass.
+        
+        Args:
+            imgs_rgb_u8: List of HxWx3 uint8 RGB images (all the same shape)
+            device: torch device
+            pad_divisor: pad to multiple of this (for encoder stride)
+        
+        Returns:
+            One probability map per image (see predict)
+        """
+        prob = self.predict_batch_tensor(imgs_rgb_u8, device, pad_divisor).cpu()
+        if self.num_classes > 1:
+            prob = prob.permute(0, 2, 3, 1)  # NxHxWxC
+        return [p.numpy() for p in prob]
+    
+    @torch.inference_mode()
+    def predict_batch_tensor(
+        self,
+        imgs_rgb_u8: List[np.ndarray],
+        device: torch.device,
+        pad_divisor: int = 32,
+    ) -> torch.Tensor:
+        """
+        Like predict_batch, but leave the probabilities on the device.
+        
+        Returns:
+            - Binary: NxHxW float32 probabilities
+            - Multi-class: NxCxHxW float32 class probabilities
+        """
+        # Fill the reused uint8 staging buffer and copy it over (async on CUDA)
+        shape = (len(imgs_rgb_u8), *imgs_rgb_u8[0].shape)
+        host = self._host_buffer(shape, device)
+        for i, img in enumerate(imgs_rgb_u8):
+            host[i].copy_(torch.from_numpy(img))
+        x_u8 = host.to(device, non_blocking=True)
+        if self._h2d_events[shape] is not None:
+            self._h2d_events[shape].record()
+        
+        return self.predict_tiles_u8(x_u8, pad_divisor)
+    
+    @torch.inference_mode()
+    def predict_tiles_u8(
+        self,
+        x_u8: torch.Tensor,
+        pad_divisor: int = 32,
+    ) -> torch.Tensor:
         """
-        # Preprocess
-        x = self.preprocess(img_rgb_u8)
+        Run inference on a batch of uint8 NHWC images already on the device.
+        
+        Scaling, normalization and divisor padding all happen on the device.
+        
+        Args:
+            x_u8: NxHxWx3 uint8 tensor on the model's device
+            pad_divisor: pad to multiple of this (for encoder stride)
         
-        # Pad to divisor
-        x, pad_hw = pad_to_divisible(x, pad_divisor)
+        Returns:
+            Same as predict_batch_tensor
+        """
+        device = x_u8.device
+        dtype = self.autocast_dtype(device)
+        h, w = x_u8.shape[1:3]
+        hp = -(-h // pad_divisor) * pad_divisor
+        wp = -(-w // pad_divisor) * pad_divisor
         
-        # Convert to tensor
-        x_t = torch.from_numpy(x.transpose(2, 0, 1)).unsqueeze(0).float().to(device)
+        # Normalize, then zero-pad to the divisor (as pad_to_divisible(preprocess(img)) did).
+        # Permuting NHWC gives channels-last strides, which .float() keeps
+        mean_t, std_t = self._norm_tensors(device)
+        x_t = x_u8.permute(0, 3, 1, 2).float().div_(255.0).sub_(mean_t).div_(std_t)
+        if hp > h or wp > w:
+            x_t = F.pad(x_t, (0, wp - w, 0, hp - h))
+        if self.channels_last:
+            x_t = x_t.contiguous(memory_format=torch.channels_last)
+        else:
+            x_t = x_t.contiguous()
         
-        # Forward pass
-        logits = self.model(x_t)
+        # Forward pass (weights stay FP32; autocast runs matmuls/convs in low precision)
+        with torch.autocast(device.type, dtype=dtype or torch.float32, enabled=dtype is not None):
+            logits = self.model(x_t)
         if isinstance(logits, (list, tuple)):
             logits = logits[0]
+        # Upcast so thresholds in post-processing see FP32 probabilities
         logits = logits.float()
         
-        # Convert to predictions
+        # Convert to predictions and drop the padding
         if self.num_classes == 1:
             # Binary segmentation
-            prob = torch.sigmoid(logits)[0, 0].cpu().numpy()
-            prob = unpad(prob, pad_hw)
-            return prob.astype(np.float32)
+            return torch.sigmoid(logits)[:, 0, :h, :w]  # NxHxW
         else:
             # Multi-class segmentation
-            prob = torch.softmax(logits, dim=1)[0].cpu().numpy()  # CxHxW
-            prob = prob.transpose(1, 2, 0)  # HxWxC
-            prob = unpad(prob, pad_hw)
-            return prob.astype(np.float32)
+            return torch.softmax(logits, dim=1)[:, :, :h, :w]  # NxCxHxW
 
 
 # ======================= Tiled Inference =======================
@@ -198,15 +542,29 @@ class TiledInference:
         overlap: float = 0.5,
         pad_mode: str = "reflect",
         pad_divisor: int = 32,
+        accumulator_dtype: str = "float32",
+        strategy: str = "uniform",
+        min_overlap: float = 0.1,
+        single_tile_native: bool = False,
     ):
         self.tile_h = tile_h
         self.tile_w = tile_w
         self.overlap = overlap
+        if strategy not in ("uniform", "fixed_corner"):
+            raise ValueError(f"Unknown tiling strategy: {strategy}")
+        self.strategy = strategy
+        self.min_overlap = min_overlap
+        self.single_tile_native = single_tile_native
         self.pad_mode = pad_mode
         self.pad_divisor = pad_divisor
+        if accumulator_dtype not in ("float32", "float16"):
+            raise ValueError(f"Unknown accumulator dtype: {accumulator_dtype}")
+        self.accumulator_dtype = accumulator_dtype
         
-        # Precompute Hann window for blending
+        # Precompute Hann window for blending (plus per-device/dtype tensor copies)
         self.window = self._hann_window(tile_h, tile_w)
+        self._window_t: Dict[Tuple[torch.device, torch.dtype], torch.Tensor] = {}
+        self._copy_streams: Dict[torch.device, "torch.cuda.Stream"] = {}
     
     def _hann_window(self, h: int, w: int, eps: float = 1e-6) -> np.ndarray:
         """Create 2D Hann window for weighted blending."""
@@ -227,30 +585,75 @@ class TiledInference:
             coords: list of (y0, y1, x0, x1) in padded coordinates
             padded_hw: (H_padded, W_padded)
         """
+        padded = self.pad_for_tiling(img_rgb_u8)
+        Hp, Wp = padded.shape[:2]
+        coords = self.tile_coords(Hp, Wp)
+        tiles = [padded[y0:y1, x0:x1] for y0, y1, x0, x1 in coords]
+        return tiles, coords, (Hp, Wp)
+    
+    def _axis_pad(self, length: int, tile: int) -> int:
+        """Padding needed along one axis for the tile grid to cover it exactly."""
+        if length <= tile:
+            return tile - length
+        if self.strategy == "fixed_corner":
+            return 0
+        stride = max(1, int(tile * (1.0 - self.overlap)))
+        return -(length - tile) % stride
+    
+    def _axis_starts(self, length: int, tile: int) -> List[int]:
+        """
+        Tile start offsets along one (padded) axis.
+        
+        "uniform" steps by tile * (1 - overlap). "fixed_corner" pins the
+        first and last tile to the image edges and spreads the fewest tiles
+        in between that keep every overlap >= min_overlap.
+        """
+        if self.strategy == "fixed_corner":
+            span = length - tile
+            if span <= 0:
+                return [0]
+            max_step = max(1, int(tile * (1.0 - self.min_overlap)))
+            n = -(-span // max_step) + 1
+            return [round(i * span / (n - 1)) for i in range(n)]
+        stride = max(1, int(tile * (1.0 - self.overlap)))
+        return list(range(0, length - tile + 1, stride))
+    
+    def fits_one_tile(self, img_rgb_u8: np.ndarray) -> bool:
+        """Whether the image is no larger than a single tile."""
         H, W = img_rgb_u8.shape[:2]
+        return H <= self.tile_h and W <= self.tile_w
+    
+    def pad_for_tiling(self, img_rgb_u8: np.ndarray) -> np.ndarray:
+        """
+        Pad bottom/right so the tile grid covers the image exactly.
         
-        # Compute stride
-        sy = max(1, int(self.tile_h * (1.0 - self.overlap)))
-        sx = max(1, int(self.tile_w * (1.0 - self.overlap)))
+        With single_tile_native, an image that fits in one tile is only padded
+        up to a multiple of pad_divisor and becomes its own (smaller) tile.
+        """
+        H, W = img_rgb_u8.shape[:2]
         
         # Compute padding
-        pad_bottom = (-(H - self.tile_h) % sy) if H > self.tile_h else (self.tile_h - H)
-        pad_right = (-(W - self.tile_w) % sx) if W > self.tile_w else (self.tile_w - W)
+        if self.single_tile_native and self.fits_one_tile(img_rgb_u8):
+            pad_bottom = -H % self.pad_divisor
+            pad_right = -W % self.pad_divisor
+        else:
+            pad_bottom = self._axis_pad(H, self.tile_h)
+            pad_right = self._axis_pad(W, self.tile_w)
         
         # Apply padding
         border = cv2.BORDER_REFLECT_101 if self.pad_mode == "reflect" else cv2.BORDER_CONSTANT
-        padded = cv2.copyMakeBorder(img_rgb_u8, 0, pad_bottom, 0, pad_right, border, value=[0, 0, 0])
-        Hp, Wp = padded.shape[:2]
-        
-        # Extract tiles
-        tiles, coords = [], []
-        for y0 in range(0, Hp - self.tile_h + 1, sy):
-            for x0 in range(0, Wp - self.tile_w + 1, sx):
-                y1, x1 = y0 + self.tile_h, x0 + self.tile_w
-                tiles.append(padded[y0:y1, x0:x1])
-                coords.append((y0, y1, x0, x1))
-        
-        return tiles, coords, (Hp, Wp)
+        return cv2.copyMakeBorder(img_rgb_u8, 0, pad_bottom, 0, pad_right, border, value=[0, 0, 0])
+    
+    def tile_coords(self, Hp: int, Wp: int) -> List[Tuple[int, int, int, int]]:
+        """(y0, y1, x0, x1) of every tile in a padded image."""
+        if Hp < self.tile_h or Wp < self.tile_w:
+            # Only a single_tile_native image is smaller than a tile
+            return [(0, Hp, 0, Wp)]
+        return [
+            (y0, y0 + self.tile_h, x0, x0 + self.tile_w)
+            for y0 in self._axis_starts(Hp, self.tile_h)
+            for x0 in self._axis_starts(Wp, self.tile_w)
+        ]
     
     def stitch_binary(
         self,
@@ -298,21 +701,184 @@ class TiledInference:
         
         Returns: HxW uint8 binary mask (0 or 255)
         """
-        # Create tiles
-        tiles, coords, padded_hw = self.make_tiles(img_rgb_u8)
+        return self.predict_batch([img_rgb_u8], model, device, threshold)[0]
+    
+    @torch.inference_mode()
+    def predict_batch(
+        self,
+        imgs_rgb_u8: List[np.ndarray],
+        model: SegModel,
+        device: torch.device,
+        threshold: float = 0.5,
+        tile_batch_size: int = 8,
+        pad_last_batch: bool = False,
+        fg_values: Optional[List[int]] = None,
+    ) -> List[np.ndarray]:
+        """
+        Run tiled inference on several images, batching tiles across images.
         
-        # Predict on each tile
-        prob_tiles = []
-        for tile in tiles:
-            prob = model.predict(tile, device, self.pad_divisor)
-            prob_tiles.append(prob)
+        Tiles of the same shape are pooled across images and pushed through
+        the model tile_batch_size at a time. Each tile's probabilities are
+        blended into its image's accumulator on the device (same weighting as
+        stitch_binary), so only the final uint8 masks are copied back to the
+        host. Images covered by a single tile skip blending (the weighted
+        average of one tile is the tile itself) and are thresholded directly.
         
-        # Stitch
-        full_padded = self.stitch_binary(prob_tiles, coords, padded_hw, threshold)
+        On CUDA, image uploads and mask downloads run on a side copy stream
+        from pinned memory, so image k+1 is copied while image k's tiles
+        compute, and finished masks are copied back while later ones are
+        thresholded.
         
-        # Crop to original size
-        H, W = img_rgb_u8.shape[:2]
-        return full_padded[:H, :W]
+        Args:
+            imgs_rgb_u8: List of HxWx3 uint8 RGB images (any sizes)
+            model: Segmentation model
+            device: torch device
+            threshold: Binary threshold applied after stitching
+            tile_batch_size: Max tiles per forward pass
+            pad_last_batch: Fill a short final forward pass with blank tiles so
+                every pass has exactly tile_batch_size tiles (one static shape
+                for torch.compile/cuDNN autotuning/staging buffers)
+            fg_values: Foreground value per image (default 255 for all), e.g.
+                class ids so the class remap happens on the device
+        
+        Returns:
+            One HxW uint8 mask (0 or the image's foreground value) per image
+        """
+        # Pad each image for tiling and upload it once as uint8; tiles are cut
+        # on the device, so overlapping pixels are not re-sent per tile
+        padded = [self.pad_for_tiling(img) for img in imgs_rgb_u8]
+        copy_stream = self._copy_stream(device)
+        imgs_dev, uploaded = self._upload(padded, device, copy_stream)
+        coords = [self.tile_coords(*p.shape[:2]) for p in padded]
+        single = [len(c) == 1 for c in coords]
+        
+        # Pool tiles by shape (only single_tile_native images differ from the tile size)
+        groups: Dict[Tuple[int, int], list] = {}
+        for k, cs in enumerate(coords):
+            for c in cs:
+                groups.setdefault((c[1] - c[0], c[3] - c[2]), []).append((k, c))
+        
+        # Per-image weighted accumulators, kept on the device (single-tile images need none)
+        acc_dtype = self._acc_dtype(device)
+        window = self._window_on(device, acc_dtype)
+        acc = [
+            None if one else torch.zeros(p.shape[:2], dtype=acc_dtype, device=device)
+            for p, one in zip(padded, single)
+        ]
+        wacc = [None if a is None else torch.zeros_like(a) for a in acc]
+        single_probs: Dict[int, torch.Tensor] = {}
+        
+        # Predict on pooled tiles in fixed-size batches and blend as they arrive
+        step = max(1, int(tile_batch_size))
+        for (th, tw), owners in groups.items():
+            for i in range(0, len(owners), step):
+                # Only wait for the uploads this chunk actually reads
+                for k in {k for k, _ in owners[i:i + step]}:
+                    if uploaded[k] is not None:
+                        torch.cuda.current_stream(device).wait_event(uploaded[k])
+                        uploaded[k] = None
+                chunk = [imgs_dev[k][y0:y1, x0:x1] for k, (y0, y1, x0, x1) in owners[i:i + step]]
+                n_real = len(chunk)
+                if pad_last_batch and n_real < step:
+                    chunk = chunk + [torch.zeros_like(chunk[0])] * (step - n_real)
+                probs = model.predict_tiles_u8(torch.stack(chunk), self.pad_divisor)[:n_real]
+                if probs.ndim != 3:
+                    raise ValueError("Tiled inference supports binary (num_classes=1) models only")
+                torch.nan_to_num_(probs, nan=0.0)
+                
+                # Ensure shape match
+                if probs.shape[-2:] != (th, tw):
+                    probs = F.interpolate(
+                        probs[:, None], size=(th, tw), mode="bilinear", align_corners=False
+                    )[:, 0]
+                
+                for prob, (k, (y0, y1, x0, x1)) in zip(probs, owners[i:i + step]):
+                    if single[k]:
+                        single_probs[k] = prob
+                        continue
+                    acc[k][y0:y1, x0:x1].addcmul_(prob.to(acc_dtype), window)
+                    wacc[k][y0:y1, x0:x1].add_(window)
+        
+        # Crop to original size, average, threshold, then one D2H copy per image
+        masks = []
+        for k, (img, a, w) in enumerate(zip(imgs_rgb_u8, acc, wacc)):
+            H, W = img.shape[:2]
+            if single[k]:
+                avg = single_probs[k][:H, :W]
+            else:
+                a, w = a[:H, :W], w[:H, :W]
+                # Average in FP32 whatever the accumulator dtype
+                avg = a.float() / w.float().masked_fill_(w == 0, 1.0)
+            fg = 255 if fg_values is None else int(fg_values[k])
+            mask = (avg >= threshold).to(torch.uint8).mul_(fg)
+            if copy_stream is None:
+                masks.append(mask.cpu())
+                continue
+            host = torch.empty(mask.shape, dtype=torch.uint8, pin_memory=True)
+            copy_stream.wait_stream(torch.cuda.current_stream(device))
+            with torch.cuda.stream(copy_stream):
+                mask.record_stream(copy_stream)
+                host.copy_(mask, non_blocking=True)
+            masks.append(host)
+        
+        if copy_stream is not None:
+            copy_stream.synchronize()
+        return [m.numpy() for m in masks]
+    
+    def _copy_stream(self, device: torch.device) -> Optional["torch.cuda.Stream"]:
+        """Side stream for H2D/D2H copies on CUDA devices (cached), else None."""
+        if device.type != "cuda":
+            return None
+        if device not in self._copy_streams:
+            self._copy_streams[device] = torch.cuda.Stream(device=device)
+        return self._copy_streams[device]
+    
+    def _upload(
+        self,
+        padded: List[np.ndarray],
+        device: torch.device,
+        copy_stream: Optional["torch.cuda.Stream"],
+    ) -> Tuple[List[torch.Tensor], List[Optional["torch.cuda.Event"]]]:
+        """
+        Copy padded uint8 images to the device.
+        
+        With a copy stream, each image is pinned and queued asynchronously;
+        the returned per-image event marks when it is safe to read.
+        """
+        if copy_stream is None:
+            return [torch.from_numpy(p).to(device) for p in padded], [None] * len(padded)
+        
+        imgs_dev, uploaded = [], []
+        compute_stream = torch.cuda.current_stream(device)
+        for p in padded:
+            host = torch.from_numpy(p).pin_memory()
+            with torch.cuda.stream(copy_stream):
+                img_dev = host.to(device, non_blocking=True)
+                event = torch.cuda.Event()
+                event.record(copy_stream)
+            # Allocated on the copy stream but read on the compute stream
+            img_dev.record_stream(compute_stream)
+            imgs_dev.append(img_dev)
+            uploaded.append(event)
+        return imgs_dev, uploaded
+    
+    def _acc_dtype(self, device: torch.device) -> torch.dtype:
+        """Blending accumulator dtype; float16 only on CUDA (CPU half math is slow)."""
+        if self.accumulator_dtype == "float16" and device.type == "cuda":
+            return torch.float16
+        return torch.float32
+    
+    def _window_on(self, device: torch.device, dtype: torch.dtype = torch.float32) -> torch.Tensor:
+        """Hann blending window as a tensor on device (cached)."""
+        key = (device, dtype)
+        if key not in self._window_t:
+            window = torch.from_numpy(self.window).to(device)
+            if dtype == torch.float16:
+                # Keep edge weights out of the FP16 subnormal range, where
+                # prob*weight loses most of its precision
+                window = window.clamp_min(1e-3)
+            self._window_t[key] = window.to(dtype)
+        return self._window_t[key]
 
 
 # ======================= Post-Processing =======================
@@ -334,23 +900,25 @@ class SegPostProcessor:
         """
         Fraction of the image's 1-pixel border occupied by the mask (0..1).
         """
-        m = mask_u8 > 0
-        if m.size == 0 or not m.any():
+        m = mask_u8
+        if m.size == 0:
             return 0.0
         
         h, w = m.shape[:2]
         
-        # Border sums
-        top = m[0, :].sum(dtype=np.int64)
-        bottom = m[-1, :].sum(dtype=np.int64) if h > 1 else 0
-        left = m[:, 0].sum(dtype=np.int64)
-        right = m[:, -1].sum(dtype=np.int64) if w > 1 else 0
+        # Border sums (only the border is read; no full-size boolean mask)
+        top = np.count_nonzero(m[0, :])
+        bottom = np.count_nonzero(m[-1, :]) if h > 1 else 0
+        left = np.count_nonzero(m[:, 0])
+        right = np.count_nonzero(m[:, -1]) if w > 1 else 0
         
         contact = top + bottom + left + right
+        if contact == 0:
+            return 0.0
         
         # Remove corners counted twice
         if h > 1 and w > 1:
-            contact -= (int(m[0, 0]) + int(m[0, -1]) + int(m[-1, 0]) + int(m[-1, -1]))
+            contact -= np.count_nonzero([m[0, 0], m[0, -1], m[-1, 0], m[-1, -1]])
         
         # Border length
         if h > 1 and w > 1:
@@ -363,46 +931,62 @@ class SegPostProcessor:
         
         return float(contact / border_len)
     
-    def remove_small_components(self, mask_u8: np.ndarray) -> np.ndarray:
-        """Remove connected components smaller than min_area."""
+    def remove_small_components(self, mask_u8: np.ndarray, fg_value: int = 255) -> np.ndarray:
+        """Remove connected components smaller than min_area (kept pixels are set to fg_value)."""
         if self.min_area <= 0:
             return mask_u8
         
+        # OpenCV's default labeling (Spaghetti/BBDT) is a parallel, decision-tree scan
         num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask_u8, connectivity=8)
+        if num_labels <= 1 or stats[1:, cv2.CC_STAT_AREA].min() >= self.min_area:
+            return mask_u8
         
-        # Keep only large components
-        mask_clean = np.zeros_like(mask_u8)
-        for i in range(1, num_labels):  # skip background (0)
-            area = stats[i, cv2.CC_STAT_AREA]
-            if area >= self.min_area:
-                mask_clean[labels == i] = 255
-        
-        return mask_clean
+        # Keep only large components: per-label lookup table, applied in one pass
+        lut = np.where(stats[:, cv2.CC_STAT_AREA] >= self.min_area, fg_value, 0).astype(np.uint8)
+        lut[0] = 0  # background
+        return lut[labels]
     
     def remap_classes(self, mask_u8: np.ndarray, class_id: int) -> np.ndarray:
         """Remap binary mask to class_id."""
         if class_id <= 0:
             return mask_u8
-        remapped = np.zeros_like(mask_u8, dtype=np.uint8)
-        remapped[mask_u8 > 0] = class_id
-        return remapped
+        return np.where(mask_u8 > 0, np.uint8(class_id), np.uint8(0))
+    
+    @staticmethod
+    def foreground_value(class_id: Optional[int]) -> int:
+        """Value remap_classes gives foreground pixels (class_id, or 255 if missing/not positive)."""
+        return int(class_id) if class_id is not None and class_id > 0 else 255
 
-    def process(self, mask_u8: np.ndarray, class_id: int) -> Tuple[np.ndarray, float]:
+    def process(
+        self,
+        mask_u8: np.ndarray,
+        class_id: int,
+        remapped: bool = False,
+    ) -> Tuple[np.ndarray, float]:
         """
         Apply post-processing to mask.
         
+        Args:
+            mask_u8: HxW uint8 mask (0 or 255)
+            class_id: Class id to remap foreground to
+            remapped: Mask foreground is already foreground_value(class_id)
+                (e.g. thresholded on the device), so the remap pass is skipped
+        
         Returns:
             processed_mask: HxW uint8 (0 or 255)
             edge_occupancy: float in [0, 1]
         """
-        # Remove small components
-        # mask_u8 = self.remove_small_components(mask_u8)
+        # Remove small components (no-op unless min_area > 0)
+        if self.min_area > 0:
+            fg_value = self.foreground_value(class_id) if remapped else 255
+            mask_u8 = self.remove_small_components(mask_u8, fg_value=fg_value)
         
         # Compute edge occupancy
         edge_occupancy = self.compute_edge_occupancy(mask_u8)
 
         # Remap classes if needed
-        mask_u8 = self.remap_classes(mask_u8, class_id)
+        if not remapped:
+            mask_u8 = self.remap_classes(mask_u8, class_id)
         
         return mask_u8, edge_occupancy
 
@@ -446,11 +1030,17 @@ class SegVisualizer:
         gt_mask: Optional[np.ndarray] = None,
         edge_occupancy: Optional[float] = None,
     ) -> None:
-        """Create 4-panel visualization plot."""
+        """
+        Create 4-panel visualization plot.
+        
+        Builds a standalone Figure (no pyplot global state), so plots can be
+        rendered on worker threads.
+        """
         overlay = self.make_overlay(img_rgb_u8, pred_mask)
         
         n_panels = 3 if gt_mask is None else 4
-        fig, axes = plt.subplots(1, n_panels, figsize=(4 * n_panels, 4))
+        fig = Figure(figsize=(4 * n_panels, 4))
+        axes = fig.subplots(1, n_panels)
         
         if n_panels == 3:
             axes = [axes[0], axes[1], axes[2]]
@@ -503,11 +1093,25 @@ class SegVisualizer:
         out_path.parent.mkdir(parents=True, exist_ok=True)
         fig.tight_layout()
         fig.savefig(out_path, bbox_inches="tight", dpi=150)
-        plt.close(fig)
 
 
 # ======================= Image Loading =======================
 
+def read_image_rgb(path: Path) -> np.ndarray:
+    """
+    Decode an image file to an HxWx3 uint8 RGB array.
+    
+    Uses OpenCV's libjpeg-turbo/libpng decoders, which avoid PIL's decode and
+    the extra PIL->NumPy copy. EXIF orientation is ignored, matching
+    Image.open(...).convert("RGB"). Falls back to PIL for formats OpenCV
+    cannot read.
+    """
+    bgr = cv2.imread(str(path), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if bgr is None:
+        return np.array(Image.open(path).convert("RGB"), dtype=np.uint8)
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+
 
 def load_image_from_record(
     record: Dict, 
@@ -550,9 +1154,7 @@ def load_image_from_record(
             return None
         
         # Load full image without any cropping
-        img = Image.open(img_path).convert("RGB")
-        img_rgb_u8 = np.array(img, dtype=np.uint8)
-        return img_rgb_u8
+        return read_image_rgb(img_path)
     
     # Original cutout mode behavior
     # SemiF paths - try cropout first
@@ -580,8 +1182,7 @@ def load_image_from_record(
         return None
     
     # Load image
-    img = Image.open(img_path).convert("RGB")
-    img_rgb_u8 = np.array(img, dtype=np.uint8)
+    img_rgb_u8 = read_image_rgb(img_path)
     
     # Apply bbox crop if needed (only in cutout mode)
     if not use_cropout:
@@ -598,6 +1199,80 @@ def load_image_from_record(
     
     return img_rgb_u8
 
+# ======================= Image Writing =======================
+
+_PIL_MODES = {2: "L", 3: "RGB", 4: "RGBA"}
+
+# JPEG chroma subsampling, PIL numbering: 0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0
+_CV2_SAMPLING = ("IMWRITE_JPEG_SAMPLING_FACTOR_444", "IMWRITE_JPEG_SAMPLING_FACTOR_422", "IMWRITE_JPEG_SAMPLING_FACTOR_420")
+
+
+def write_image(
+    path: Path,
+    arr: np.ndarray,
+    backend: str = "cv2",
+    png_compression: int = 1,
+    jpeg_quality: int = 100,
+    jpeg_subsampling: int = 0,
+) -> None:
+    """
+    Write an 8-bit L/RGB/RGBA array as PNG or JPEG (chosen by suffix).
+    
+    The "cv2" backend uses OpenCV's bundled libpng/libjpeg-turbo encoders,
+    which are considerably faster than PIL; "pil" is kept as a fallback.
+    With the "cv2" backend, RGB JPEGs go straight through libjpeg-turbo
+    (PyTurboJPEG) when it is installed, skipping the RGB->BGR copy.
+    
+    Args:
+        path: Output path (.png, .jpg or .jpeg)
+        arr: (H, W), (H, W, 3) RGB or (H, W, 4) RGBA uint8 array
+        backend: "cv2" or "pil"
+        png_compression: zlib level for PNG (0-9, cv2 only)
+        jpeg_quality: JPEG quality (0-100)
+        jpeg_subsampling: Chroma subsampling, 0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0
+    """
+    if jpeg_subsampling not in (0, 1, 2):
+        raise ValueError(f"Unknown JPEG subsampling: {jpeg_subsampling}")
+    channels = 2 if arr.ndim == 2 else arr.shape[2]
+    is_jpeg = Path(path).suffix.lower() in (".jpg", ".jpeg")
+    
+    if backend == "pil":
+        img = Image.fromarray(arr, mode=_PIL_MODES[channels])
+        if is_jpeg:
+            img.save(path, format="JPEG", quality=jpeg_quality, subsampling=jpeg_subsampling, optimize=False)
+        else:
+            img.save(path, format="PNG")
+        return
+    
+    if backend != "cv2":
+        raise ValueError(f"Unknown image backend: {backend}")
+    
+    if is_jpeg and channels == 3 and _turbojpeg is not None:
+        buf = _turbojpeg.encode(
+            np.ascontiguousarray(arr),
+            quality=jpeg_quality,
+            pixel_format=TJPF_RGB,
+            jpeg_subsample=(TJSAMP_444, TJSAMP_422, TJSAMP_420)[jpeg_subsampling],
+        )
+        Path(path).write_bytes(buf)
+        return
+    
+    if channels == 3:
+        arr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+    elif channels == 4:
+        arr = cv2.cvtColor(arr, cv2.COLOR_RGBA2BGRA)
+    
+    if is_jpeg:
+        params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        if hasattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR"):
+            params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, getattr(cv2, _CV2_SAMPLING[jpeg_subsampling])]
+    else:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    
+    if not cv2.imwrite(str(path), arr, params):
+        raise OSError(f"Failed to write image: {path}")
+
+
 # ======================= Array Utilities =======================
 
 def pad_to_divisible(
@@ -2,6 +2,10 @@
 from agir_cvtoolkit.core.db.types import ImageRecord
 from typing import Optional
 
+# Keys _rec_to_dict adds on top of the DB columns, only when the record has them
+_REC_DERIVED_KEYS = ("image_path", "mask_path")
+
+
 def _rec_to_dict(r: ImageRecord) -> dict:
     """
     Emit ALL DB columns 1:1 from r.extras,
@@ -8,6 +8,7 @@ Consolidates:
 - Augmentation builders
 - Batch collate functions
 - Lightning module
+- Async checkpoint IO
 - Visualization tools
 - Helper utilities
 """
@@ -33,8 +34,10 @@ import torch.nn as nn
 import torch.nn.functional as F
 from albumentations.pytorch import ToTensorV2
 from omegaconf import DictConfig
+from lightning_utilities.core.apply_func import apply_to_collection
 from PIL import Image
-from pytorch_lightning import LightningModule
+from pytorch_lightning import Callback, LightningModule
+from pytorch_lightning.plugins.io import AsyncCheckpointIO
 from torch import Tensor
 from torch.utils.data import Dataset
 from torch.utils.data._utils.collate import default_collate
@@ -349,34 +352,17 @@ def _build_pixel_transforms(cfg) -> List[A.BasicTransform]:
 # BATCH-LEVEL AUGMENTATIONS (COLLATE FUNCTIONS)
 # ============================================================================
 
-def mixup_collate(
-    batch: List[Tuple[torch.Tensor, torch.Tensor]],
-    p: float,
-    alpha: float
-) -> Tuple[torch.Tensor, torch.Tensor]:
-    """MixUp augmentation."""
-    imgs, masks = zip(*batch)
-    imgs = torch.stack(imgs, 0)
-    masks = torch.stack(masks, 0)
-    
+def _mixup(imgs: torch.Tensor, masks: torch.Tensor, p: float, alpha: float) -> Tuple[torch.Tensor, torch.Tensor]:
+    """MixUp on a stacked batch, in place (lerp towards a shuffled copy)."""
     if random.random() < p:
-        lam = np.random.beta(alpha, alpha)
-        idx = torch.randperm(imgs.size(0))
-        mixed_imgs = lam * imgs + (1 - lam) * imgs[idx]
-        mixed_masks = lam * masks + (1 - lam) * masks[idx]
-        return mixed_imgs, mixed_masks
-    
+        weight = 1.0 - float(np.random.beta(alpha, alpha))
+        idx = torch.randperm(imgs.size(0), device=imgs.device)
+        imgs.lerp_(imgs[idx], weight)
+        masks.lerp_(masks[idx], weight)
     return imgs, masks
 
-def cutmix_collate(
-    batch: List[Tuple[torch.Tensor, torch.Tensor]],
-    p: float,
-    alpha: float
-) -> Tuple[torch.Tensor, torch.Tensor]:
-    """CutMix augmentation."""
-    imgs, masks = zip(*batch)
-    imgs = torch.stack(imgs, 0)
-    masks = torch.stack(masks, 0)
+def _cutmix(imgs: torch.Tensor, masks: torch.Tensor, p: float, alpha: float) -> Tuple[torch.Tensor, torch.Tensor]:
+    """CutMix on a stacked batch, in place (pastes a box from one sample into another)."""
     B, C_img, H, W = imgs.shape
     
     if B >= 2 and random.random() < p:
@@ -394,43 +380,32 @@ def cutmix_collate(
         x2 = min(W, cx + cut_w // 2)
         y2 = min(H, cy + cut_h // 2)
         
-        new_img = imgs[out_idx].clone()
-        new_mask = masks[out_idx].clone()
-        new_img[:, y1:y2, x1:x2] = imgs[other_idx][:, y1:y2, x1:x2]
-        new_mask[:, y1:y2, x1:x2] = masks[other_idx][:, y1:y2, x1:x2]
-        
-        imgs[out_idx] = new_img
-        masks[out_idx] = new_mask
+        # Distinct samples, so the slices never overlap and no clone is needed
+        imgs[out_idx, :, y1:y2, x1:x2] = imgs[other_idx, :, y1:y2, x1:x2]
+        masks[out_idx, :, y1:y2, x1:x2] = masks[other_idx, :, y1:y2, x1:x2]
     
     return imgs, masks
 
-def mosaic_collate(
-    batch: List[Tuple[torch.Tensor, torch.Tensor]],
-    p: float
-) -> Tuple[torch.Tensor, torch.Tensor]:
-    """Mosaic augmentation."""
-    imgs, masks = zip(*batch)
-    imgs = torch.stack(imgs, 0)
-    masks = torch.stack(masks, 0)
+def _mosaic(imgs: torch.Tensor, masks: torch.Tensor, p: float) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Mosaic on a stacked batch, in place (replaces one sample with a 2x2 of four)."""
     B, C_img, H, W = imgs.shape
     
     if random.random() < p and B >= 4:
         src_idxs = random.sample(range(B), 4)
-        q_imgs = imgs[src_idxs]
-        q_masks = masks[src_idxs]
         
-        canvas_img = torch.zeros((C_img, 2*H, 2*W), device=imgs.device, dtype=imgs.dtype)
-        canvas_mask = torch.zeros((1, 2*H, 2*W), device=masks.device, dtype=masks.dtype)
+        # Canvas is filled before anything is written back, so plain views suffice
+        canvas_img = torch.empty((C_img, 2*H, 2*W), device=imgs.device, dtype=imgs.dtype)
+        canvas_mask = torch.empty((1, 2*H, 2*W), device=masks.device, dtype=masks.dtype)
         
-        canvas_img[:, :H, :W] = q_imgs[0]
-        canvas_img[:, :H, W:2*W] = q_imgs[1]
-        canvas_img[:, H:2*H, :W] = q_imgs[2]
-        canvas_img[:, H:2*H, W:2*W] = q_imgs[3]
+        canvas_img[:, :H, :W] = imgs[src_idxs[0]]
+        canvas_img[:, :H, W:2*W] = imgs[src_idxs[1]]
+        canvas_img[:, H:2*H, :W] = imgs[src_idxs[2]]
+        canvas_img[:, H:2*H, W:2*W] = imgs[src_idxs[3]]
         
-        canvas_mask[:, :H, :W] = q_masks[0]
-        canvas_mask[:, :H, W:2*W] = q_masks[1]
-        canvas_mask[:, H:2*H, :W] = q_masks[2]
-        canvas_mask[:, H:2*H, W:2*W] = q_masks[3]
+        canvas_mask[:, :H, :W] = masks[src_idxs[0]]
+        canvas_mask[:, :H, W:2*W] = masks[src_idxs[1]]
+        canvas_mask[:, H:2*H, :W] = masks[src_idxs[2]]
+        canvas_mask[:, H:2*H, W:2*W] = masks[src_idxs[3]]
         
         mos_img = F.interpolate(
             canvas_img.unsqueeze(0),
@@ -450,6 +425,69 @@ def mosaic_collate(
     
     return imgs, masks
 
+def mixup_collate(
+    batch: List[Tuple[torch.Tensor, torch.Tensor]],
+    p: float,
+    alpha: float
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """MixUp augmentation."""
+    imgs, masks = zip(*batch)
+    return _mixup(torch.stack(imgs, 0), torch.stack(masks, 0), p, alpha)
+
+def cutmix_collate(
+    batch: List[Tuple[torch.Tensor, torch.Tensor]],
+    p: float,
+    alpha: float
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """CutMix augmentation."""
+    imgs, masks = zip(*batch)
+    return _cutmix(torch.stack(imgs, 0), torch.stack(masks, 0), p, alpha)
+
+def mosaic_collate(
+    batch: List[Tuple[torch.Tensor, torch.Tensor]],
+    p: float
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Mosaic augmentation."""
+    imgs, masks = zip(*batch)
+    return _mosaic(torch.stack(imgs, 0), torch.stack(masks, 0), p)
+
+def apply_batch_mixing(
+    imgs: torch.Tensor,
+    masks: torch.Tensor,
+    batch_cfg: Any,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Apply the enabled batch-level augmentations (mosaic, cutmix, mixup) to a stacked batch.
+    
+    Pure tensor ops, so this runs wherever the batch lives: in the collate
+    function on CPU workers, or on the GPU after transfer. The batch is
+    modified in place; it is never unstacked and re-stacked between steps.
+    """
+    if not batch_cfg or not batch_cfg.get("enable", False):
+        return imgs, masks
+    
+    if batch_cfg.get("mosaic", {}).get("enable", False):
+        imgs, masks = _mosaic(
+            imgs, masks,
+            p=batch_cfg.mosaic.get("p", 0.5)
+        )
+    
+    if batch_cfg.get("cutmix", {}).get("enable", False):
+        imgs, masks = _cutmix(
+            imgs, masks,
+            p=batch_cfg.cutmix.get("p", 0.5),
+            alpha=batch_cfg.cutmix.get("alpha", 1.0)
+        )
+    
+    if batch_cfg.get("mixup", {}).get("enable", False):
+        imgs, masks = _mixup(
+            imgs, masks,
+            p=batch_cfg.mixup.get("p", 0.5),
+            alpha=batch_cfg.mixup.get("alpha", 0.2)
+        )
+    
+    return imgs, masks
+
 def get_batch_collate_fn(batch_cfg: Any) -> Callable:
     """Build collate function with batch-level augmentations."""
     if not batch_cfg or not batch_cfg.get("enable", False):
@@ -457,31 +495,79 @@ def get_batch_collate_fn(batch_cfg: Any) -> Callable:
     
     def collate(batch):
         imgs, masks = default_collate(batch)
-        
-        if batch_cfg.get("mosaic", {}).get("enable", False):
-            imgs, masks = mosaic_collate(
-                list(zip(imgs, masks)),
-                p=batch_cfg.mosaic.get("p", 0.5)
-            )
-        
-        if batch_cfg.get("cutmix", {}).get("enable", False):
-            imgs, masks = cutmix_collate(
-                list(zip(imgs, masks)),
-                p=batch_cfg.cutmix.get("p", 0.5),
-                alpha=batch_cfg.cutmix.get("alpha", 1.0)
-            )
-        
-        if batch_cfg.get("mixup", {}).get("enable", False):
-            imgs, masks = mixup_collate(
-                list(zip(imgs, masks)),
-                p=batch_cfg.mixup.get("p", 0.5),
-                alpha=batch_cfg.mixup.get("alpha", 0.2)
-            )
-        
-        return imgs, masks
+        return apply_batch_mixing(imgs, masks, batch_cfg)
     
     return collate
 
+# ============================================================================
+# GPU PREFETCHING
+# ============================================================================
+
+class CUDAPrefetcher:
+    """
+    Iterate a DataLoader with the next batch's host-to-device copy in flight.
+    
+    Copies run on a side CUDA stream (non_blocking, from pinned memory), so
+    batch N+1 uploads while batch N computes; the consuming stream waits on
+    the copy's event before the batch is handed out. Other attributes
+    (dataset, batch_size, ...) are forwarded to the wrapped loader.
+    """
+    
+    def __init__(self, loader, device: torch.device) -> None:
+        self.loader = loader
+        self.device = torch.device(device)
+        self.stream = torch.cuda.Stream(device=self.device)
+    
+    def __len__(self) -> int:
+        return len(self.loader)
+    
+    def __getattr__(self, name: str):
+        return getattr(self.loader, name)
+    
+    def _to_device(self, batch):
+        """Copy a (nested) batch of tensors to the device without blocking."""
+        if isinstance(batch, Tensor):
+            return batch.to(self.device, non_blocking=True)
+        if isinstance(batch, (list, tuple)):
+            return type(batch)(self._to_device(b) for b in batch)
+        if isinstance(batch, dict):
+            return {k: self._to_device(v) for k, v in batch.items()}
+        return batch
+    
+    def _record_stream(self, batch, stream) -> None:
+        """Mark side-stream allocations as used by the consuming stream."""
+        if isinstance(batch, Tensor):
+            batch.record_stream(stream)
+        elif isinstance(batch, (list, tuple)):
+            for b in batch:
+                self._record_stream(b, stream)
+        elif isinstance(batch, dict):
+            for b in batch.values():
+                self._record_stream(b, stream)
+    
+    def _preload(self, it):
+        """Start copying the next batch; None when the loader is exhausted."""
+        try:
+            batch = next(it)
+        except StopIteration:
+            return None
+        with torch.cuda.stream(self.stream):
+            batch = self._to_device(batch)
+            event = torch.cuda.Event()
+            event.record(self.stream)
+        return batch, event
+    
+    def __iter__(self):
+        it = iter(self.loader)
+        nxt = self._preload(it)
+        while nxt is not None:
+            batch, event = nxt
+            nxt = self._preload(it)
+            stream = torch.cuda.current_stream(self.device)
+            stream.wait_event(event)
+            self._record_stream(batch, stream)
+            yield batch
+
 # ============================================================================
 # LIGHTNING MODULE
 # ============================================================================
@@ -511,6 +597,15 @@ class LitSegmentation(LightningModule):
         
         self.model = smp.create_model(**model_kwargs)
         
+        # Batch mixing (mosaic/cutmix/mixup) on the device instead of in the collate fn
+        self.gpu_batch_augment = bool(cfg.train.get("gpu_batch_augment", False)) and torch.cuda.is_available()
+        self.batch_aug_cfg = cfg.augment.train.get("batch", {})
+        
+        # NHWC layout lets cuDNN pick its Tensor Core conv kernels (CUDA only)
+        self.channels_last = bool(cfg.train.get("channels_last", False)) and torch.cuda.is_available()
+        if self.channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        
         # Loss
         self.loss_fn = nn.BCEWithLogitsLoss()
         
@@ -526,12 +621,21 @@ class LitSegmentation(LightningModule):
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         return self.model(x)
     
+    def on_after_batch_transfer(self, batch, dataloader_idx: int):
+        """Apply GPU batch mixing (training only) and match the model's memory format."""
+        imgs, masks = batch
+        if self.gpu_batch_augment and self.trainer.training:
+            imgs, masks = apply_batch_mixing(imgs, masks, self.batch_aug_cfg)
+        if self.channels_last:
+            imgs = imgs.contiguous(memory_format=torch.channels_last)
+        return imgs, masks
+    
     def training_step(self, batch, batch_idx):
         imgs, masks = batch
         logits = self(imgs)
         loss = self.loss_fn(logits, masks)
         
-        preds = (torch.sigmoid(logits) > 0.5).long()
+        preds = (logits > 0).long()  # == sigmoid(logits) > 0.5
         self.train_iou.update(preds, masks.long())
         self.train_dice.update(preds, masks.long())
         
@@ -546,7 +650,7 @@ class LitSegmentation(LightningModule):
         logits = self(imgs)
         loss = self.loss_fn(logits, masks)
         
-        preds = (torch.sigmoid(logits) > 0.5).long()
+        preds = (logits > 0).long()  # == sigmoid(logits) > 0.5
         self.val_iou.update(preds, masks.long())
         self.val_dice.update(preds, masks.long())
         
@@ -576,6 +680,51 @@ class LitSegmentation(LightningModule):
             }
         }
 
+# ============================================================================
+# ASYNC CHECKPOINTING
+# ============================================================================
+
+class SnapshotAsyncCheckpointIO(AsyncCheckpointIO):
+    """
+    Write checkpoints on a background thread, after snapshotting tensors to CPU.
+    
+    AsyncCheckpointIO hands the checkpoint dict to a worker thread as-is, and
+    its tensors alias the live parameters and optimizer state, which keep
+    being updated while torch.save serializes them. Copying every tensor to
+    CPU first keeps the saved state consistent. The device-to-host copy takes
+    milliseconds and the disk write happens off the training loop.
+    Lightning waits for pending saves when the strategy tears down.
+    """
+    
+    def save_checkpoint(self, checkpoint, path, storage_options=None) -> None:
+        snapshot = apply_to_collection(
+            checkpoint, Tensor, lambda t: t.detach().to("cpu", copy=True)
+        )
+        super().save_checkpoint(snapshot, path, storage_options=storage_options)
+
+
+class BestCheckpointStep(Callback):
+    """
+    Record the global step at which a ModelCheckpoint's best_model_path was written.
+    
+    ModelCheckpoint updates best_model_path just before dumping the new best
+    checkpoint, and every dump calls on_save_checkpoint, so a changed path
+    seen here was written at the current step. save_last dumps leave the path
+    unchanged and a score tie with an earlier epoch keeps the older path, so
+    neither moves best_step.
+    """
+    
+    def __init__(self, checkpoint_cb) -> None:
+        self.checkpoint_cb = checkpoint_cb
+        self.best_path = ""
+        self.best_step: int | None = None
+    
+    def on_save_checkpoint(self, trainer, pl_module, checkpoint) -> None:
+        path = self.checkpoint_cb.best_model_path
+        if path and path != self.best_path:
+            self.best_path, self.best_step = path, trainer.global_step
+
+
 # ============================================================================
 # VISUALIZATION FUNCTIONS
 # ============================================================================
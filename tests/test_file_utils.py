@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from agir_cvtoolkit.pipelines.utils import file_utils
+from agir_cvtoolkit.pipelines.utils.file_utils import fast_copy, place_file
+
+
+# ───────────────────────── Fixtures ─────────────────────────
+
+@pytest.fixture
+def src_file(tmp_path) -> Path:
+    """A small source file with known content."""
+    p = tmp_path / "src.bin"
+    p.write_bytes(os.urandom(64 * 1024) + b"tail")
+    return p
+
+
+# ───────────────────────── fast_copy ─────────────────────────
+
+def test_fast_copy_copies_content(src_file, tmp_path):
+    dst = fast_copy(src_file, tmp_path / "dst.bin")
+    assert dst.read_bytes() == src_file.read_bytes()
+
+
+def test_fast_copy_same_file_raises(src_file):
+    with pytest.raises(shutil.SameFileError):
+        fast_copy(src_file, src_file)
+    # Source must not have been truncated
+    assert src_file.stat().st_size > 0
+
+
+def test_fast_copy_falls_back_when_copy_file_range_returns_zero(src_file, tmp_path, monkeypatch):
+    # Some filesystems report 0 bytes copied at offset 0 instead of failing
+    monkeypatch.setattr(os, "copy_file_range", lambda *a, **k: 0, raising=False)
+    dst = fast_copy(src_file, tmp_path / "dst.bin")
+    assert dst.read_bytes() == src_file.read_bytes()
+
+
+def test_fast_copy_falls_back_after_partial_copy(src_file, tmp_path, monkeypatch):
+    # Both kernel paths copy a few bytes then report 0; fast_copy must discard
+    # the partial output and still produce the full file. Later calls (from
+    # shutil's own fallback) go to the real syscalls.
+    real_copy_file_range = getattr(os, "copy_file_range", None)
+    real_sendfile = getattr(os, "sendfile", None)
+    calls = {"cfr": 0, "sf": 0}
+
+    def short_copy_file_range(src_fd, dst_fd, count, *args):
+        calls["cfr"] += 1
+        if calls["cfr"] == 1:
+            return os.write(dst_fd, os.read(src_fd, 100))
+        if calls["cfr"] == 2:
+            return 0
+        return real_copy_file_range(src_fd, dst_fd, count, *args)
+
+    def short_sendfile(out_fd, in_fd, offset, count):
+        calls["sf"] += 1
+        if calls["sf"] == 1:
+            os.lseek(in_fd, offset, os.SEEK_SET)
+            return os.write(out_fd, os.read(in_fd, 10))
+        if calls["sf"] == 2:
+            return 0
+        return real_sendfile(out_fd, in_fd, offset, count)
+
+    monkeypatch.setattr(os, "copy_file_range", short_copy_file_range, raising=False)
+    monkeypatch.setattr(os, "sendfile", short_sendfile, raising=False)
+    dst = fast_copy(src_file, tmp_path / "dst.bin")
+    assert calls["cfr"] >= 2 and calls["sf"] >= 2
+    assert dst.read_bytes() == src_file.read_bytes()
+
+
+# ───────────────────────── place_file ─────────────────────────
+
+def test_place_file_same_file_is_noop(src_file):
+    assert place_file(src_file, src_file, mode="hardlink") == src_file
+    assert src_file.stat().st_size > 0
+
+
+def test_place_file_hardlink(src_file, tmp_path):
+    dst = place_file(src_file, tmp_path / "link.bin", mode="hardlink")
+    assert os.path.samefile(src_file, dst)
+
+
+def test_place_file_hardlink_falls_back_to_copy(src_file, tmp_path, monkeypatch):
+    def fail_link(*args, **kwargs):
+        raise OSError("cross-device link")
+
+    monkeypatch.setattr(file_utils.os, "link", fail_link)
+    dst = place_file(src_file, tmp_path / "copy.bin", mode="hardlink")
+    assert not os.path.samefile(src_file, dst)
+    assert dst.read_bytes() == src_file.read_bytes()
+
+
+def test_place_file_symlink(src_file, tmp_path):
+    dst = place_file(src_file, tmp_path / "sym.bin", mode="symlink")
+    assert dst.is_symlink()
+    assert dst.resolve() == src_file.resolve()
+
+
+def test_place_file_replaces_existing_link_target(src_file, tmp_path):
+    dst = tmp_path / "sym.bin"
+    dst.write_bytes(b"stale")
+    place_file(src_file, dst, mode="symlink")
+    assert dst.read_bytes() == src_file.read_bytes()
+
+
+@pytest.mark.parametrize("link_mode", ["hardlink", "symlink"])
+def test_place_file_copy_over_link_keeps_link_source(tmp_path, link_mode):
+    a, b, dst = tmp_path / "a.bin", tmp_path / "b.bin", tmp_path / "dst.bin"
+    a.write_bytes(b"aaaa")
+    b.write_bytes(b"bbbb")
+    place_file(a, dst, mode=link_mode)
+    place_file(b, dst, mode="copy")
+    assert a.read_bytes() == b"aaaa"
+    assert dst.read_bytes() == b"bbbb"
+    assert not dst.is_symlink()
+
+
+def test_place_file_replaces_dangling_symlink(src_file, tmp_path):
+    dst = tmp_path / "sym.bin"
+    os.symlink(tmp_path / "missing.bin", dst)
+    place_file(src_file, dst, mode="symlink")
+    assert dst.resolve() == src_file.resolve()
+
+
+def test_place_file_rejects_unknown_mode(src_file, tmp_path):
+    with pytest.raises(ValueError):
+        place_file(src_file, tmp_path / "x.bin", mode="move")
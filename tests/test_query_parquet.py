@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from agir_cvtoolkit.pipelines.stages import query as query_mod
+from agir_cvtoolkit.pipelines.stages.query import save_records_as_dataframe
+
+
+# ───────────────────────── Fixtures ─────────────────────────
+
+@pytest.fixture(autouse=True)
+def plain_dict_records(monkeypatch):
+    """Feed plain dicts instead of ImageRecord objects."""
+    monkeypatch.setattr(query_mod, "_rec_to_dict", dict)
+    yield
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    """Shrink the Parquet batch size so a few rows span several batches."""
+    monkeypatch.setattr(query_mod, "_PARQUET_BATCH_SIZE", 3)
+    yield 3
+
+
+# ───────────────────────── Tests ─────────────────────────
+
+def test_sparse_column_spanning_batches(tmp_path, small_batches):
+    # "note" is None for the whole first batch, set later; no declared type
+    recs = [{"id": i, "note": None if i < 5 else f"n{i}"} for i in range(8)]
+    out_path = tmp_path / "query.parquet"
+
+    save_records_as_dataframe(None, "parquet", out_path, recs)
+
+    table = pq.read_table(out_path)
+    assert table.num_rows == 8
+    assert table.schema.field("note").type == pa.string()
+    assert table.column("note").to_pylist() == [None] * 5 + ["n5", "n6", "n7"]
+
+
+def test_numeric_affinity_int_then_float(tmp_path, small_batches):
+    recs = [{"id": i, "score": i if i < 3 else i + 0.5} for i in range(6)]
+    out_path = tmp_path / "query.parquet"
+
+    save_records_as_dataframe(None, "parquet", out_path, recs, schema={"id": "INTEGER", "score": "NUMERIC"})
+
+    table = pq.read_table(out_path)
+    assert table.schema.field("score").type == pa.float64()
+    assert table.column("score").to_pylist() == [0.0, 1.0, 2.0, 3.5, 4.5, 5.5]
+
+
+def test_unmapped_affinity_is_stringified(tmp_path, small_batches):
+    recs = [{"ts": 1700000000 if i < 3 else "2024-01-01 00:00:00"} for i in range(5)]
+    out_path = tmp_path / "query.parquet"
+
+    save_records_as_dataframe(None, "parquet", out_path, recs, schema={"ts": "DATETIME"})
+
+    table = pq.read_table(out_path)
+    assert table.schema.field("ts").type == pa.string()
+    assert table.column("ts").to_pylist() == ["1700000000"] * 3 + ["2024-01-01 00:00:00"] * 2
+
+
+def test_declared_type_mismatch_falls_back_per_column(tmp_path, small_batches):
+    # "flag" is declared BOOLEAN but stores 0/1; "name" must keep its declared type
+    recs = [{"flag": i % 2, "name": f"r{i}"} for i in range(5)]
+    out_path = tmp_path / "query.parquet"
+
+    save_records_as_dataframe(None, "parquet", out_path, recs, schema={"flag": "BOOLEAN", "name": "TEXT"})
+
+    table = pq.read_table(out_path)
+    assert table.schema.field("flag").type == pa.int64()
+    assert table.schema.field("name").type == pa.string()
+    assert table.column("flag").to_pylist() == [0, 1, 0, 1, 0]
+
+
+def test_later_batch_value_that_does_not_fit_is_preserved(tmp_path, small_batches):
+    # Inferred int64 from the first batch; a later string widens the column to string
+    recs = [{"count": i if i != 4 else "many"} for i in range(6)]
+    out_path = tmp_path / "query.parquet"
+
+    save_records_as_dataframe(None, "parquet", out_path, recs)
+
+    table = pq.read_table(out_path)
+    assert table.num_rows == 6
+    assert table.schema.field("count").type == pa.string()
+    assert table.column("count").to_pylist() == ["0", "1", "2", "3", "many", "5"]
+
+
+def test_later_float_widens_declared_integer_column(tmp_path, small_batches):
+    # SQLite lets an INTEGER column hold floats; rows already written are re-encoded
+    recs = [{"id": i, "area": i if i < 7 else i + 0.25} for i in range(9)]
+    out_path = tmp_path / "query.parquet"
+
+    save_records_as_dataframe(None, "parquet", out_path, recs, schema={"id": "INTEGER", "area": "INTEGER"})
+
+    table = pq.read_table(out_path)
+    assert table.schema.field("id").type == pa.int64()
+    assert table.schema.field("area").type == pa.float64()
+    assert table.column("area").to_pylist() == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.25, 8.25]
+    assert not list(tmp_path.glob("*.widen"))
+
+
+@pytest.mark.parametrize("out", ["csv", "parquet"])
+def test_derived_path_missing_from_first_record_is_kept(tmp_path, out):
+    # _rec_to_dict omits mask_path when a row has none
+    recs = [{"id": 0, "image_path": "a.jpg"}, {"id": 1, "image_path": "b.jpg", "mask_path": "b.png"}]
+    out_path = tmp_path / f"query.{out}"
+
+    save_records_as_dataframe(None, out, out_path, recs)
+
+    if out == "parquet":
+        assert pq.read_table(out_path).column("mask_path").to_pylist() == [None, "b.png"]
+    else:
+        assert out_path.read_text().splitlines() == ["id,image_path,mask_path", "0,a.jpg,", "1,b.jpg,b.png"]
+
+
+def test_empty_records_write_empty_file(tmp_path):
+    out_path = tmp_path / "query.parquet"
+    save_records_as_dataframe(None, "parquet", out_path, [])
+    assert pq.read_table(out_path).num_rows == 0